@@ -0,0 +1,185 @@
+"""
+NetworkManager checkpoints, used to roll back the network configuration.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from concurrent.futures import Future
+from typing import Callable, Tuple
+
+import gi  # pylint: disable=C0411
+gi.require_version("NM", "1.0")
+from gi.repository import NM, Gio  # noqa: E402 pylint: disable=C0413
+
+# pylint: disable-next=wrong-import-position
+from proton.vpn.killswitch.backend.linux.networkmanager.futures import (  # noqa: E402
+    chain_exception, set_future_exception, set_future_result
+)
+# pylint: disable-next=wrong-import-position
+from proton.vpn.killswitch.backend.linux.networkmanager.metrics import (  # noqa: E402
+    MetricsSink, OperationTimer
+)
+
+
+class NMCheckpoints:
+    """
+    Creates, rolls back and destroys NetworkManager checkpoints.
+    Instances are obtained with `NMClient.checkpoints`.
+    """
+    def __init__(
+            self, nm_client: NM.Client, run_on_glib_loop_thread: Callable[..., Future],
+            create_operation_future: Callable[[], Tuple[Future, Gio.Cancellable]],
+            metrics: MetricsSink
+    ):
+        """
+        :param nm_client: NetworkManager client.
+        :param run_on_glib_loop_thread: function running a function on the
+            thread iterating the main context of the NetworkManager client.
+        :param create_operation_future: function creating the future tracking
+            an operation, together with its cancellable.
+        :param metrics: sink receiving the latency metrics of the operations.
+        """
+        self._nm_client = nm_client
+        self._run_on_glib_loop_thread = run_on_glib_loop_thread
+        self._create_operation_future = create_operation_future
+        self._metrics = metrics
+
+    def can_create(self) -> bool:
+        """
+        Returns if the user is allowed to create and roll back checkpoints
+        without being asked for authentication.
+
+        Only the YES permission result is accepted, since the kill switch can't
+        wait for the user to authenticate. By default, polkit answers AUTH to
+        regular desktop users, so this method usually returns False unless a
+        polkit rule grants them the checkpoint-rollback permission.
+
+        The permission is cached by NM.Client, so this method does not block.
+        """
+        return self._nm_client.get_permission_result(
+            NM.ClientPermission.CHECKPOINT_ROLLBACK
+        ) == NM.ClientPermissionResult.YES
+
+    def create_async(self, rollback_timeout: int) -> Future:
+        """
+        Creates a checkpoint of the current network configuration of all devices.
+        https://lazka.github.io/pgi-docs/#NM-1.0/classes/Client.html#NM.Client.checkpoint_create
+
+        Connections added and devices created after the checkpoint are
+        removed when rolling back.
+        :param rollback_timeout: time, in seconds, after which NetworkManager
+            rolls back automatically to the checkpoint if it wasn't destroyed
+            nor rolled back before. 0 disables the automatic rollback.
+        :return: a Future resolving to the NM.Checkpoint. Cancelling it cancels
+            the operation.
+        """
+        future_checkpoint, cancellable = self._create_operation_future()
+        timer = OperationTimer(self._metrics, "checkpoint_create")
+        timer.finish_with_future(future_checkpoint)
+
+        def _on_checkpoint_created(nm_client, res, _user_data):
+            try:
+                checkpoint = nm_client.checkpoint_create_finish(res)
+            except Exception as exc:  # pylint: disable=broad-except
+                set_future_exception(
+                    future_checkpoint,
+                    RuntimeError(
+                        f"Error creating checkpoint: {nm_client=}, {res=}"
+                    ).with_traceback(exc.__traceback__)
+                )
+                return
+
+            set_future_result(future_checkpoint, checkpoint)
+
+        def _checkpoint_create_async():
+            if future_checkpoint.done():
+                return  # The operation was cancelled before it started.
+
+            # An empty list of devices means all devices.
+            self._nm_client.checkpoint_create(
+                [], rollback_timeout,
+                NM.CheckpointCreateFlags.DELETE_NEW_CONNECTIONS
+                | NM.CheckpointCreateFlags.DISCONNECT_NEW_DEVICES,
+                cancellable, _on_checkpoint_created, None
+            )
+
+        chain_exception(
+            self._run_on_glib_loop_thread(_checkpoint_create_async), future_checkpoint
+        )
+
+        return future_checkpoint
+
+    def rollback_async(self, checkpoint: NM.Checkpoint) -> Future:
+        """
+        Rolls back the network configuration to the specified checkpoint,
+        which is destroyed afterwards.
+        https://lazka.github.io/pgi-docs/#NM-1.0/classes/Client.html#NM.Client.checkpoint_rollback
+        :param checkpoint: checkpoint to roll back to.
+        :return: a Future to keep track of completion. Cancelling it cancels
+            the operation.
+        """
+        return self._finish_async(checkpoint, rollback=True)
+
+    def destroy_async(self, checkpoint: NM.Checkpoint) -> Future:
+        """
+        Destroys the specified checkpoint, keeping the current network configuration.
+        https://lazka.github.io/pgi-docs/#NM-1.0/classes/Client.html#NM.Client.checkpoint_destroy
+        :param checkpoint: checkpoint to be destroyed.
+        :return: a Future to keep track of completion. Cancelling it cancels
+            the operation.
+        """
+        return self._finish_async(checkpoint, rollback=False)
+
+    def _finish_async(self, checkpoint: NM.Checkpoint, rollback: bool) -> Future:
+        action = "rollback" if rollback else "destroy"
+        future_checkpoint_finished, cancellable = self._create_operation_future()
+        timer = OperationTimer(self._metrics, f"checkpoint_{action}")
+        timer.finish_with_future(future_checkpoint_finished)
+
+        def _on_checkpoint_finished(nm_client, res, _user_data):
+            try:
+                if rollback:
+                    nm_client.checkpoint_rollback_finish(res)
+                else:
+                    nm_client.checkpoint_destroy_finish(res)
+            except Exception as exc:  # pylint: disable=broad-except
+                set_future_exception(
+                    future_checkpoint_finished,
+                    RuntimeError(
+                        f"Error on checkpoint {action}: {nm_client=}, {res=}"
+                    ).with_traceback(exc.__traceback__)
+                )
+                return
+
+            set_future_result(future_checkpoint_finished)
+
+        def _finish_checkpoint_async():
+            if future_checkpoint_finished.done():
+                return  # The operation was cancelled before it started.
+
+            finish = (
+                self._nm_client.checkpoint_rollback if rollback
+                else self._nm_client.checkpoint_destroy
+            )
+            finish(checkpoint.get_path(), cancellable, _on_checkpoint_finished, None)
+
+        chain_exception(
+            self._run_on_glib_loop_thread(_finish_checkpoint_async), future_checkpoint_finished
+        )
+
+        return future_checkpoint_finished
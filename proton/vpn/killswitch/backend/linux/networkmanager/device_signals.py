@@ -0,0 +1,80 @@
+"""
+Dispatching of the NetworkManager device signals to the operations waiting for them.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from collections import defaultdict
+from typing import Callable
+
+import gi  # pylint: disable=C0411
+gi.require_version("NM", "1.0")
+from gi.repository import NM  # noqa: E402 pylint: disable=C0413
+
+
+class DeviceSignalDispatcher:
+    """
+    Dispatches the device-added and device-removed signals emitted by
+    NM.Client to the callbacks waiting for them, by interface name.
+
+    A single handler per signal is connected to NM.Client, so that the cost
+    of a device event does not depend on the number of operations in flight,
+    even on systems where unrelated interfaces come and go constantly.
+
+    Callbacks are registered, dispatched and unregistered from the GLib loop thread.
+    """
+    DEVICE_ADDED = "device-added"
+    DEVICE_REMOVED = "device-removed"
+
+    def __init__(self):
+        # signal -> interface name -> callbacks
+        self._waiters = {
+            self.DEVICE_ADDED: defaultdict(list),
+            self.DEVICE_REMOVED: defaultdict(list),
+        }
+
+    def attach(self, nm_client: NM.Client):
+        """Subscribes to the device signals emitted by the client."""
+        for signal in self._waiters:
+            nm_client.connect(signal, self._dispatch, signal)
+
+    def add_waiter(self, signal: str, interface_name: str, callback: Callable[[NM.Device], None]):
+        """Registers a callback to be called with the device each time
+        the signal is emitted for the specified interface."""
+        self._waiters[signal][interface_name].append(callback)
+
+    def remove_waiter(
+            self, signal: str, interface_name: str, callback: Callable[[NM.Device], None]
+    ):
+        """Unregisters a callback previously registered with `add_waiter`."""
+        waiters = self._waiters[signal].get(interface_name)
+        if not waiters or callback not in waiters:
+            return
+
+        waiters.remove(callback)
+        if not waiters:
+            del self._waiters[signal][interface_name]
+
+    def _dispatch(self, _nm_client, device, signal):
+        waiters = self._waiters[signal].get(device.get_iface())
+        if not waiters:
+            return
+
+        # Callbacks might unregister themselves while being dispatched.
+        for callback in list(waiters):
+            callback(device)
@@ -0,0 +1,85 @@
+"""
+Helpers to resolve the futures tracking NetworkManager operations.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from concurrent.futures import Future, InvalidStateError
+
+
+def create_future() -> Future:
+    """Creates a future and sets its internal state as running."""
+    future = Future()
+    future.set_running_or_notify_cancel()
+    return future
+
+
+def create_resolved_future(result=None) -> Future:
+    """Creates a future which is already resolved with the specified result."""
+    future = create_future()
+    future.set_result(result)
+    return future
+
+
+def set_future_result(future: Future, result=None):
+    """
+    Resolves the future with the specified result, unless it was already done
+    (e.g. because it was cancelled while the operation was still running).
+    """
+    try:
+        future.set_result(result)
+    except (InvalidStateError, asyncio.InvalidStateError):
+        pass
+
+
+def set_future_exception(future: Future, exc: BaseException):
+    """
+    Sets the exception on the future, unless it was already done
+    (e.g. because it was cancelled while the operation was still running).
+    """
+    try:
+        future.set_exception(exc)
+    except (InvalidStateError, asyncio.InvalidStateError):
+        pass
+
+
+def chain_future(source: Future, target: Future):
+    """Propagates the outcome of the source future to the target future."""
+    def _on_source_done(source_future: Future):
+        if source_future.cancelled():
+            target.cancel()
+        elif source_future.exception():
+            set_future_exception(target, source_future.exception())
+        else:
+            set_future_result(target, source_future.result())
+
+    source.add_done_callback(_on_source_done)
+
+
+def chain_exception(source: Future, target: Future):
+    """
+    Propagates the exception raised by the source future, if any,
+    to the target future.
+    """
+    def _on_source_done(source_future: Future):
+        exc = source_future.exception()
+        if exc:
+            set_future_exception(target, exc)
+
+    source.add_done_callback(_on_source_done)
@@ -20,7 +20,11 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
 """
-from dataclasses import dataclass, field
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, fields
+from threading import Lock
+from typing import Callable, Hashable, Optional
+import hashlib
 import uuid
 
 import gi  # pylint: disable=C0411
@@ -30,6 +34,13 @@ from gi.repository import NM, GLib  # noqa: E402 pylint: disable=C0413
 
 DEFAULT_METRIC = -1
 
+# Maximum number of connection profile templates kept in memory.
+TEMPLATE_CACHE_SIZE = 16
+
+# Key of the user data holding the fingerprint of the settings a kill switch
+# connection profile was created with.
+FINGERPRINT_USER_DATA_KEY = "org.protonvpn.killswitch.fingerprint"
+
 
 @dataclass
 class KillSwitchGeneralConfig:  # pylint: disable=missing-class-docstring
@@ -38,14 +49,94 @@ class KillSwitchGeneralConfig:  # pylint: disable=missing-class-docstring
 
 
 @dataclass
-class KillSwitchIPConfig:  # pylint: disable=missing-class-docstring
+class KillSwitchIPConfig:  # pylint: disable=missing-class-docstring,too-many-instance-attributes
     addresses: list
     dns: list
     dns_priority: str
     ignore_auto_dns: bool
     route_metric: str
     gateway: str = None
-    routes: list = field(default_factory=list)
+    routes: list = field(default_factory=list)  # (network address, prefix length) tuples
+    # Routing rules, in `ip rule` syntax (e.g. "priority 100 to 1.1.1.1/32 table 254").
+    routing_rules: list = field(default_factory=list)
+    route_table: int = 0  # 0 means the main table.
+
+
+class _ConnectionTemplateCache:
+    """
+    Bounded LRU cache of pre-verified connection profiles.
+
+    Building a connection profile from scratch requires dozens of calls over
+    GObject introspection, while cloning an existing one only requires one.
+    """
+    def __init__(self, max_size: int = TEMPLATE_CACHE_SIZE):
+        self._max_size = max_size
+        self._templates = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, create_template: Callable[[], NM.Connection]) -> NM.Connection:
+        """
+        Returns a clone of the template with the specified key, creating the
+        template first if it was not cached yet.
+        """
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                template = create_template()
+                self._templates[key] = template
+                if len(self._templates) > self._max_size:
+                    self._templates.popitem(last=False)
+            else:
+                self._templates.move_to_end(key)
+
+            return NM.SimpleConnection.new_clone(template)
+
+    def clear(self):
+        """Removes all cached templates."""
+        with self._lock:
+            self._templates.clear()
+
+
+_template_cache = _ConnectionTemplateCache()
+
+
+def _freeze(value):
+    """Returns a hashable version of the specified value."""
+    if isinstance(value, dict):
+        return tuple((key, _freeze(item)) for key, item in sorted(value.items()))
+
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+
+    return value
+
+
+def _get_ip_config_shape(ip_config: KillSwitchIPConfig):
+    """
+    Returns the part of the IP config shared by all connections with the same
+    shape. Routes and routing rules are excluded since they change depending
+    on the server IPs.
+    """
+    if ip_config is None:
+        return None
+
+    return _freeze({
+        ip_config_field.name: getattr(ip_config, ip_config_field.name)
+        for ip_config_field in fields(ip_config)
+        if ip_config_field.name not in ("routes", "routing_rules")
+    })
+
+
+def get_connection_fingerprint(connection: NM.Connection) -> Optional[str]:
+    """
+    Returns the fingerprint of the settings the specified kill switch connection
+    profile was created with, or None if it was created without one.
+    """
+    s_user = connection.get_setting_by_name(NM.SETTING_USER_SETTING_NAME)
+    if s_user is None:
+        return None
+
+    return s_user.get_data(FINGERPRINT_USER_DATA_KEY)
 
 
 class KillSwitchConnection:  # pylint: disable=too-few-public-methods
@@ -60,6 +151,7 @@ class KillSwitchConnection:  # pylint: disable=too-few-public-methods
         ipv4_settings: KillSwitchIPConfig
     ):
         self._connection_profile = None
+        self._fingerprint = None
         self._general_settings = general_settings
         self._ipv6_settings = ipv6_settings
         self._ipv4_settings = ipv4_settings
@@ -72,8 +164,60 @@ class KillSwitchConnection:  # pylint: disable=too-few-public-methods
 
         return self._connection_profile
 
+    @property
+    def fingerprint(self) -> str:
+        """
+        Stable hash of the connection settings, which is stored in the
+        connection profile to be able to tell if an existing profile
+        was created with the same settings.
+        """
+        if self._fingerprint is None:
+            settings = _freeze({
+                "general": asdict(self._general_settings),
+                "ipv4": asdict(self._ipv4_settings) if self._ipv4_settings else None,
+                "ipv6": asdict(self._ipv6_settings) if self._ipv6_settings else None,
+            })
+            self._fingerprint = hashlib.sha256(repr(settings).encode()).hexdigest()
+
+        return self._fingerprint
+
     def _create_connection_profile(self):
-        self._connection_profile = NM.SimpleConnection.new()
+        """
+        Creates the connection profile by cloning the template with the same
+        shape (interface and IP settings) and then patching the settings
+        that change from one connection to another: ID, UUID, fingerprint,
+        routes and routing rules.
+        """
+        template_key = (
+            self._general_settings.interface_name,
+            _get_ip_config_shape(self._ipv4_settings),
+            _get_ip_config_shape(self._ipv6_settings)
+        )
+        self._connection_profile = _template_cache.get(template_key, self._create_template)
+
+        s_con = self._connection_profile.get_setting_connection()
+        s_con.set_property(NM.SETTING_CONNECTION_ID, self._general_settings.human_readable_id)
+        s_con.set_property(NM.SETTING_CONNECTION_UUID, str(uuid.uuid4()))
+
+        s_user = self._connection_profile.get_setting_by_name(NM.SETTING_USER_SETTING_NAME)
+        s_user.set_data(FINGERPRINT_USER_DATA_KEY, self.fingerprint)
+
+        if self._ipv4_settings is not None:
+            s_ip4 = self._connection_profile.get_setting_ip4_config()
+            self._add_routes(s_ip4, self._ipv4_settings, GLib.SYSDEF_AF_INET)
+            self._add_routing_rules(
+                s_ip4, self._ipv4_settings, NM.IPRoutingRuleAsStringFlags.AF_INET
+            )
+
+        if self._ipv6_settings is not None:
+            s_ip6 = self._connection_profile.get_setting_ip6_config()
+            self._add_routes(s_ip6, self._ipv6_settings, GLib.SYSDEF_AF_INET6)
+            self._add_routing_rules(
+                s_ip6, self._ipv6_settings, NM.IPRoutingRuleAsStringFlags.AF_INET6
+            )
+
+    def _create_template(self) -> NM.Connection:
+        template = NM.SimpleConnection.new()
 
         s_con = NM.SettingConnection.new()
         s_con.set_property(NM.SETTING_CONNECTION_ID, self._general_settings.human_readable_id)
@@ -85,20 +229,24 @@ class KillSwitchConnection:  # pylint: disable=too-few-public-methods
         s_con.set_property(NM.SETTING_CONNECTION_TYPE, NM.SETTING_DUMMY_SETTING_NAME)
 
         s_dummy = NM.SettingDummy.new()
+        s_user = NM.SettingUser.new()
 
         s_ipv4 = self._generate_ipv4_settings()
         s_ipv6 = self._generate_ipv6_settings()
 
-        self._connection_profile.add_setting(s_con)
-        self._connection_profile.add_setting(s_ipv4)
-        self._connection_profile.add_setting(s_ipv6)
-        self._connection_profile.add_setting(s_dummy)
+        template.add_setting(s_con)
+        template.add_setting(s_ipv4)
+        template.add_setting(s_ipv6)
+        template.add_setting(s_dummy)
+        template.add_setting(s_user)
 
         # Ensures the properties get correct values
         # https://lazka.github.io/pgi-docs/index.html#NM-1.0/classes/Connection.html#NM.Connection.verify
         if not s_con.verify():
             raise RuntimeError("Connection has invalid properties")
 
+        return template
+
     def _generate_ipv4_settings(self):
         """
         For documentation see:
@@ -127,16 +275,6 @@ class KillSwitchConnection:  # pylint: disable=too-few-public-methods
         for dns in self._ipv4_settings.dns:
             s_ip4.add_dns(dns)
 
-        # Add routes
-        for route in self._ipv4_settings.routes:
-            ipv4, prefix = str(route).split("/")
-            s_ip4.add_route(
-                NM.IPRoute.new(
-                    family=GLib.SYSDEF_AF_INET, dest=ipv4, prefix=int(prefix),
-                    next_hop=None, metric=DEFAULT_METRIC
-                )
-            )
-
         # Rest of the configs
         s_ip4.props.dns_priority = self._ipv4_settings.dns_priority
         s_ip4.props.route_metric = self._ipv4_settings.route_metric
@@ -145,8 +283,34 @@ class KillSwitchConnection:  # pylint: disable=too-few-public-methods
         if self._ipv4_settings.gateway:
             s_ip4.props.gateway = self._ipv4_settings.gateway
 
+        if self._ipv4_settings.route_table:
+            s_ip4.props.route_table = self._ipv4_settings.route_table
+
         return s_ip4
 
+    @staticmethod
+    def _add_routes(s_ip: NM.SettingIPConfig, ip_settings: KillSwitchIPConfig, family: int):
+        for address, prefix in ip_settings.routes:
+            s_ip.add_route(
+                NM.IPRoute.new(
+                    family=family, dest=address, prefix=prefix,
+                    next_hop=None, metric=DEFAULT_METRIC
+                )
+            )
+
+    @staticmethod
+    def _add_routing_rules(
+            s_ip: NM.SettingIPConfig, ip_settings: KillSwitchIPConfig,
+            family_flag: NM.IPRoutingRuleAsStringFlags
+    ):
+        """
+        For documentation see:
+        https://lazka.github.io/pgi-docs/NM-1.0/classes/IPRoutingRule.html#NM.IPRoutingRule.from_string
+        """
+        for routing_rule in ip_settings.routing_rules:
+            rule = NM.IPRoutingRule.from_string(routing_rule, family_flag, None)
+            s_ip.add_routing_rule(rule)
+
     def _generate_ipv6_settings(self):
         """
         For documentation see:
@@ -182,4 +346,7 @@ class KillSwitchConnection:  # pylint: disable=too-few-public-methods
         if self._ipv6_settings.gateway:
             s_ip6.props.gateway = self._ipv6_settings.gateway
 
+        if self._ipv6_settings.route_table:
+            s_ip6.props.route_table = self._ipv6_settings.route_table
+
         return s_ip6
@@ -19,18 +19,54 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
 """
-from ipaddress import ip_network
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+from typing import Any, Awaitable, Iterable, List, Mapping, Optional, Tuple, Union
 import asyncio
 import concurrent.futures
+from ipaddress import ip_network
+import functools
+import re
 
 from proton.vpn import logging
 from proton.vpn.killswitch.backend.linux.networkmanager.nmclient import NMClient
 from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_connection import (
-    KillSwitchConnection, KillSwitchGeneralConfig, KillSwitchIPConfig
+    KillSwitchConnection, KillSwitchGeneralConfig, KillSwitchIPConfig,
+    get_connection_fingerprint
+)
+from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_status import (
+    KillSwitchConnectionStatus, KillSwitchStatus,
+    MODE_FULL, MODE_ROUTED, MODE_IPV6_LEAK_PROTECTION
+)
+from proton.vpn.killswitch.backend.linux.networkmanager.metrics import (
+    MetricsSink, OperationTimer, measure
+)
+from proton.vpn.killswitch.backend.linux.networkmanager.route_planner import (
+    create_network_set, get_routes_excluding
 )
 
 logger = logging.getLogger(__name__)
 
+# Either a single server IP/CIDR or a collection of them.
+ServerIps = Union[str, Iterable[str]]
+
+# Time, in seconds, NetworkManager operations are given to complete by default.
+DEFAULT_TIMEOUT = 5
+
+# Routing table holding the default route of the routed kill switch, when
+# routing rules are used, and priority of the first of its routing rules.
+ROUTED_KS_ROUTE_TABLE = 28585
+ROUTED_KS_RULE_PRIORITY = 28585
+MAIN_ROUTE_TABLE = 254
+
+# Time, in seconds, after which NetworkManager rolls back a transaction
+# automatically, in case the process running it did not finish it (e.g. it crashed).
+CHECKPOINT_ROLLBACK_TIMEOUT = 60
+
+# Number of times destroying a checkpoint is attempted before giving up.
+CHECKPOINT_DESTROY_ATTEMPTS = 2
+
 
 def _get_connection_id(prefix: str, permanent: bool, ipv6: bool = False, routed: bool = False):
     if ipv6:
@@ -46,20 +82,152 @@ def _get_interface_name(permanent: bool, ipv6: bool = False, routed: bool = Fals
     return f"{'pvpnrouteintrf' if routed else 'pvpnksintrf'}{'1' if permanent else '0'}"
 
 
-async def _wrap_future(future: concurrent.futures.Future, timeout=5):
-    """Wraps a concurrent.future.Future object in an asyncio.Future object."""
+# Interface names used by kill switch connections (see _get_interface_name).
+_INTERFACE_NAME_PATTERN = re.compile(r"(pvpnksintrf|pvpnrouteintrf|ipv6leakintrf)\d+")
+
+
+def _is_killswitch_connection(prefix: str, connection) -> bool:
+    """Returns whether the connection ID and interface name match the ones
+    used by kill switch connections with the specified prefix."""
+    connection_id_pattern = rf"{re.escape(prefix)}(-routed)?-killswitch(-ipv6)?(-perm)?"
+    return bool(
+        re.fullmatch(connection_id_pattern, connection.get_id() or "")
+        and _INTERFACE_NAME_PATTERN.fullmatch(connection.get_interface_name() or "")
+    )
+
+
+def _get_server_ip_list(server_ip: ServerIps) -> List[str]:
+    server_ips = [server_ip] if isinstance(server_ip, str) else list(server_ip)
+    if not server_ips:
+        raise ValueError("At least one server IP is required.")
+
+    return server_ips
+
+
+def _get_networks(server_ips: List[str], version: int) -> List[str]:
+    """Returns the server IPs/CIDRs of the specified IP version, in CIDR notation."""
+    networks = (ip_network(server_ip, strict=False) for server_ip in server_ips)
+    return [str(network) for network in networks if network.version == version]
+
+
+def _has_same_settings(connection, kill_switch: KillSwitchConnection) -> bool:
+    """Returns if the connection profile was created with the kill switch settings."""
+    return get_connection_fingerprint(connection) == kill_switch.fingerprint
+
+
+@dataclass
+class OperationResult:
+    """Result of one of the operations run by `KillSwitchConnectionHandler.run_batch`."""
+    name: str
+    result: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def succeeded(self) -> bool:
+        """Returns whether the operation succeeded or not."""
+        return self.error is None
+
+
+# Timer of the handler operation being run in the current asyncio task.
+_current_timer: ContextVar[Optional[OperationTimer]] = ContextVar("_current_timer", default=None)
+
+
+def _measured(method):
+    """Decorator measuring the latency and the outcome of a handler operation."""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        with measure(self._metrics, method.__name__) as timer:  # pylint: disable=protected-access
+            token = _current_timer.set(timer)
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                _current_timer.reset(token)
+
+    return wrapper
+
+
+def _mark_phase(phase: str):
+    """Records that a phase of the handler operation being run just ended."""
+    timer = _current_timer.get()
+    if timer:
+        timer.mark(phase)
+
+
+async def _wrap_future(future: concurrent.futures.Future, timeout=DEFAULT_TIMEOUT):
+    """
+    Wraps a concurrent.future.Future object in an asyncio.Future object.
+    Asyncio futures, returned by the asyncio engine of NMClient, are awaited as they are.
+
+    If the timeout expires or the asyncio future is cancelled, the wrapped
+    future is cancelled too, which cancels the NetworkManager operation.
+    """
     return await asyncio.wait_for(
         asyncio.wrap_future(future, loop=asyncio.get_running_loop()),
         timeout=timeout
     )
 
 
-class KillSwitchConnectionHandler:
+# Besides one attribute per option, the handler keeps its caches as attributes.
+class KillSwitchConnectionHandler:  # pylint: disable=too-many-instance-attributes
     """Kill switch connection management."""
 
-    def __init__(self, nm_client: NMClient = None, connection_prefix: str = None):
+    # The options are keyword-only, so the number of arguments does not
+    # make calls ambiguous.
+    def __init__(  # pylint: disable=too-many-arguments
+            self, nm_client: NMClient = None, connection_prefix: str = None, *,
+            reuse_permanent_connection: bool = False, metrics: MetricsSink = None,
+            timeouts: Mapping[str, float] = None, use_routing_rules: bool = False,
+            allowed_networks: Iterable[str] = ()
+    ):
+        """
+        :param nm_client: NetworkManager client.
+        :param connection_prefix: prefix of the kill switch connection IDs.
+        :param reuse_permanent_connection: whether the permanent full kill switch
+            connection should be kept on disk when it's not needed, and just be
+            reactivated afterwards, instead of being removed and added again.
+        :param metrics: sink receiving the latency metrics of the kill switch
+            operations. It's also passed to the NetworkManager client, unless
+            the client is provided.
+        :param timeouts: time, in seconds, each NetworkManager operation is given
+            to complete, by operation name: "add_connection", "remove_connection",
+            "activate_connection", "deactivate_connection", "update_connection",
+            "disable_connectivity_check", "checkpoint_create", "checkpoint_rollback"
+            and "checkpoint_destroy". Operations not specified are given
+            `DEFAULT_TIMEOUT` seconds.
+        :param use_routing_rules: whether the routed kill switch should let the
+            server IPs through with routing rules instead of routes. By default,
+            the routes covering all the IP address space except the server
+            IPs are added (around 32 routes per server IP). With routing rules,
+            a single rule per server IP is added instead, so that the number
+            of routes and the cost of switching servers stay constant.
+        :param allowed_networks: IPs/CIDRs that should remain reachable while
+            the routed kill switch is enabled (e.g. LAN subnets). They are merged
+            and deduplicated once, and the resulting routes are cached by
+            allow-list fingerprint, so large allow-lists don't slow kill switch
+            operations down. The full kill switch and the IPv6 leak protection
+            ignore them, since they must not take precedence over the VPN routes.
+        :raises ValueError: if any of the allowed IPs/CIDRs is not valid.
+        """
+        self._metrics = metrics or MetricsSink()
         self._nm_client = nm_client
         self._connection_prefix = connection_prefix or "pvpn"
+        self._reuse_permanent_connection = reuse_permanent_connection
+        self._timeouts = dict(timeouts or {})
+        self._use_routing_rules = use_routing_rules
+        self._allowed_networks = create_network_set(allowed_networks)
+        # Mode and permanence of each kill switch connection, by connection ID.
+        self._connection_modes = {
+            _get_connection_id(self._connection_prefix, permanent, ipv6=ipv6, routed=routed):
+                (mode, permanent)
+            for permanent in (False, True)
+            for mode, ipv6, routed in (
+                (MODE_FULL, False, False),
+                (MODE_ROUTED, False, True),
+                (MODE_IPV6_LEAK_PROTECTION, True, False),
+            )
+        }
+        # (active connection states, status built from them)
+        self._status_cache = (None, KillSwitchStatus())
         self._ipv6_ks_settings = KillSwitchIPConfig(
             addresses=["fdeb:446c:912d:08da::/64"],
             dns=["::1"],
@@ -69,31 +237,87 @@ class KillSwitchConnectionHandler:
             route_metric=95
         )
 
-    @staticmethod
-    def _get_ipv4_ks_settings(server_ip: str = None):
-        if server_ip:
-            # accept/block all routes except the server IP route.
-            routes = list(ip_network('0.0.0.0/0').address_exclude(ip_network(server_ip)))
-            gateway = None
-        else:
-            routes = []  # accept/block all routes.
-            gateway = "100.85.0.1"
-
+    def _get_ipv4_ks_settings(self, server_ips: List[str] = None):
+        routes, routing_rules, route_table = self._get_routed_ks_settings(
+            server_ips, version=4
+        )
         return KillSwitchIPConfig(
             addresses=["100.85.0.1/24"],
             dns=["0.0.0.0"],  # nosec hardcoded_bind_all_interfaces
             dns_priority=-1400,
-            gateway=gateway,
+            # Without IPs to let through, all traffic is accepted/blocked.
+            gateway=None if routes else "100.85.0.1",
             ignore_auto_dns=True,
             route_metric=98,
-            routes=routes
+            routes=routes,
+            routing_rules=routing_rules,
+            route_table=route_table
         )
 
+    def _get_ipv6_ks_settings(self, server_ips: List[str] = None):
+        routes, routing_rules, route_table = self._get_routed_ks_settings(
+            server_ips, version=6
+        )
+        if not routes and not routing_rules:
+            return self._ipv6_ks_settings
+
+        return replace(
+            self._ipv6_ks_settings,
+            gateway=None if routes else self._ipv6_ks_settings.gateway,
+            routes=routes,
+            routing_rules=routing_rules,
+            route_table=route_table
+        )
+
+    def _get_routed_ks_settings(
+            self, server_ips: Optional[List[str]], version: int
+    ) -> Tuple[list, list, int]:
+        """
+        Returns the routes, routing rules and routing table letting the server
+        IPs and the allowed networks of the specified IP version through the
+        routed kill switch.
+
+        Nothing is let through without server IPs, i.e. for the full kill switch
+        and the IPv6 leak protection: they only work because their default
+        route has a worse metric than the one of the VPN connection, and any
+        more specific route, or any routing rule, would take precedence over it.
+        """
+        if not server_ips:
+            return [], [], 0
+
+        networks = _get_networks(server_ips, version)
+        allowed_networks = self._allowed_networks.get_networks(version)
+        if not networks and not allowed_networks:
+            return [], [], 0
+
+        if not self._use_routing_rules:
+            # accept/block all routes except the server IP and allowed routes.
+            routes = get_routes_excluding(networks, version, self._allowed_networks)
+            return list(routes), [], 0
+
+        networks.extend(str(network) for network in allowed_networks)
+
+        # The default route is added to a dedicated table, which is looked
+        # up for all traffic except the one going to the server IPs and the
+        # one matching the main table non-default routes (e.g. the LAN).
+        routing_rules = [
+            f"priority {ROUTED_KS_RULE_PRIORITY} to {network} table {MAIN_ROUTE_TABLE}"
+            for network in networks
+        ] + [
+            f"priority {ROUTED_KS_RULE_PRIORITY + 1} table {MAIN_ROUTE_TABLE} "
+            f"suppress_prefixlength 0",
+            f"priority {ROUTED_KS_RULE_PRIORITY + 2} table {ROUTED_KS_ROUTE_TABLE}",
+        ]
+        return [], routing_rules, ROUTED_KS_ROUTE_TABLE
+
+    def _get_timeout(self, operation: str) -> float:
+        return self._timeouts.get(operation, DEFAULT_TIMEOUT)
+
     @property
     def nm_client(self):
         """Returns the NetworkManager client."""
         if self._nm_client is None:
-            self._nm_client = NMClient()
+            self._nm_client = NMClient(metrics=self._metrics)
 
         return self._nm_client
 
@@ -107,6 +331,35 @@ class KillSwitchConnectionHandler:
         """Returns if connectivity_check property is enabled or not."""
         return self.nm_client.connectivity_check_get_enabled()
 
+    def status(self) -> KillSwitchStatus:
+        """
+        Returns a snapshot of the kill switch status.
+
+        The status is built from the active connection states kept up to date
+        by NetworkManager signals, and it's cached until they change, so this
+        method neither blocks nor talks to NetworkManager.
+        """
+        states = self.nm_client.get_active_connection_states()
+        cached_states, cached_status = self._status_cache
+        if states is cached_states:
+            return cached_status
+
+        connections = []
+        for connection_id, (state, since) in sorted(states.items()):
+            if connection_id not in self._connection_modes:
+                continue
+
+            mode, permanent = self._connection_modes[connection_id]
+            connections.append(KillSwitchConnectionStatus(
+                connection_id=connection_id, mode=mode, permanent=permanent,
+                state=state, since=since
+            ))
+
+        status = KillSwitchStatus(connections=tuple(connections))
+        self._status_cache = (states, status)
+        return status
+
+    @_measured
     async def add_full_killswitch_connection(self, permanent: bool):
         """Adds full kill switch connection to Network Manager. This connection blocks all
         outgoing traffic when not connected to VPN, with the exception of torrent client which will
@@ -114,59 +367,150 @@ class KillSwitchConnectionHandler:
         await self._ensure_connectivity_check_is_disabled()
 
         connection_id = _get_connection_id(self._connection_prefix, permanent)
-        connection = self.nm_client.get_active_connection(
-            conn_id=connection_id
-        )
-
-        if connection:
-            logger.debug("Kill switch was already present.")
-            return
-
-        interface_name = _get_interface_name(permanent)
         general_config = KillSwitchGeneralConfig(
             human_readable_id=connection_id,
-            interface_name=interface_name
+            interface_name=_get_interface_name(permanent)
         )
-
         kill_switch = KillSwitchConnection(
             general_config,
             ipv4_settings=self._get_ipv4_ks_settings(),
-            ipv6_settings=self._ipv6_ks_settings,
+            ipv6_settings=self._get_ipv6_ks_settings(),
         )
-        await _wrap_future(
-            self.nm_client.add_connection_async(kill_switch.connection, save_to_disk=permanent)
+
+        connection = await _wrap_future(
+            self.nm_client.get_active_connection_async(conn_id=connection_id)
         )
 
-        logger.debug(f"{'Permanent' if permanent else 'Non-permanent'} kill switch added.")
+        if connection:
+            await self._update_connection_if_outdated(connection_id, kill_switch)
+            logger.debug("Kill switch was already present.")
+            return
+
+        if permanent and self._reuse_permanent_connection:
+            connection = await _wrap_future(
+                self.nm_client.get_connection_async(conn_id=connection_id)
+            )
+            if connection and not _has_same_settings(connection, kill_switch):
+                # The profile on disk was created with different settings.
+                await self._remove_connection(connection_id)
+                connection = None
+
+        if connection:
+            await _wrap_future(
+                self.nm_client.activate_connection_async(connection),
+                timeout=self._get_timeout("activate_connection")
+            )
+            _mark_phase("activate_connection")
+            logger.debug("Permanent kill switch reactivated.")
+        else:
+            await self._add_connection(kill_switch, save_to_disk=permanent)
+            logger.debug(f"{'Permanent' if permanent else 'Non-permanent'} kill switch added.")
+
         await self._remove_connection(
             connection_id=_get_connection_id(self._connection_prefix, permanent=not permanent)
         )
         logger.debug(f"{'Non-permanent' if permanent else 'Permanent'} kill switch removed.")
 
-    async def add_routed_killswitch_connection(self, server_ip: str, permanent: bool):
+    @_measured
+    async def add_routed_killswitch_connection(self, server_ip: ServerIps, permanent: bool):
         """Add routed kill switch connection to Network Manager.
 
         This connection has a "hole punched in it", to allow only the server IP to
         access the outside world while blocking all other outgoing traffic. This is only
         temporary though as it will be removed once we establish a VPN connection and will
         get replaced by the full kill switch connection.
+
+        A collection of server IPs/CIDRs can be passed instead of a single one, so that
+        several servers can be tried in turn without having to update the connection.
         """
+        server_ips = _get_server_ip_list(server_ip)
         await self._ensure_connectivity_check_is_disabled()
 
+        connection_id = _get_connection_id(self._connection_prefix, permanent, routed=True)
         general_config = KillSwitchGeneralConfig(
-            human_readable_id=_get_connection_id(self._connection_prefix, permanent, routed=True),
+            human_readable_id=connection_id,
             interface_name=_get_interface_name(permanent, routed=True)
         )
         kill_switch = KillSwitchConnection(
             general_config,
-            ipv4_settings=self._get_ipv4_ks_settings(server_ip),
-            ipv6_settings=self._ipv6_ks_settings,
+            ipv4_settings=self._get_ipv4_ks_settings(server_ips),
+            ipv6_settings=self._get_ipv6_ks_settings(server_ips),
         )
-        await _wrap_future(
-            self.nm_client.add_connection_async(kill_switch.connection, save_to_disk=permanent)
+
+        active_connection = await _wrap_future(
+            self.nm_client.get_active_connection_async(conn_id=connection_id)
         )
+        if active_connection:
+            if await self._update_connection_if_outdated(connection_id, kill_switch):
+                logger.debug("Routed kill switch was already present.")
+                return
+
+            # Otherwise, the new profile would be added next to the stale one,
+            # with the same ID and on the same interface.
+            await self._remove_connection(connection_id)
+
+        await self._add_connection(kill_switch, save_to_disk=permanent)
         logger.debug("Routed kill switch added.")
 
+    @_measured
+    async def update_routed_killswitch_connection(
+            self, server_ip: ServerIps, permanent: bool
+    ) -> bool:
+        """Updates the routed kill switch connection in place, so that it only
+        allows the specified server IP, or collection of server IPs/CIDRs, through.
+
+        Contrary to removing the routed kill switch connection and adding it again,
+        the kill switch interface is not torn down: the new routes are reapplied
+        to the existing device.
+
+        :return: True if the routed kill switch connection was updated, or it
+            already had the same settings, or False if it could not be updated
+            (e.g. because it was not active).
+        """
+        server_ips = _get_server_ip_list(server_ip)
+        connection_id = _get_connection_id(self._connection_prefix, permanent, routed=True)
+        active_connection = await _wrap_future(
+            self.nm_client.get_active_connection_async(conn_id=connection_id)
+        )
+        if not active_connection:
+            logger.debug("There was no routed kill switch to update.")
+            return False
+
+        connection = await _wrap_future(
+            self.nm_client.get_connection_async(conn_id=connection_id)
+        )
+        if not connection:
+            return False
+
+        general_config = KillSwitchGeneralConfig(
+            human_readable_id=connection_id,
+            interface_name=_get_interface_name(permanent, routed=True)
+        )
+        kill_switch = KillSwitchConnection(
+            general_config,
+            ipv4_settings=self._get_ipv4_ks_settings(server_ips),
+            ipv6_settings=self._get_ipv6_ks_settings(server_ips),
+        )
+        if _has_same_settings(connection, kill_switch):
+            logger.debug("Routed kill switch already had the same settings.")
+            return True
+
+        new_connection = kill_switch.connection
+        _mark_phase("build_profile")
+        try:
+            await _wrap_future(
+                self.nm_client.update_connection_async(connection, new_connection),
+                timeout=self._get_timeout("update_connection")
+            )
+        except (RuntimeError, asyncio.TimeoutError):
+            logger.warning("Routed kill switch could not be updated.", exc_info=True)
+            return False
+        _mark_phase("update_connection")
+
+        logger.debug("Routed kill switch updated.")
+        return True
+
+    @_measured
     async def add_ipv6_leak_protection(self):
         """Adds IPv6 kill switch to NetworkManager. This connection is mainly
         to prevent IPv6 leaks while using IPv4."""
@@ -175,13 +519,6 @@ class KillSwitchConnectionHandler:
         connection_id = _get_connection_id(
             self._connection_prefix, permanent=False, ipv6=True
         )
-        connection = self.nm_client.get_active_connection(
-            conn_id=connection_id)
-
-        if connection:
-            logger.debug("IPv6 leak protection already present.")
-            return
-
         interface_name = _get_interface_name(permanent=False, ipv6=True)
         general_config = KillSwitchGeneralConfig(
             human_readable_id=connection_id,
@@ -191,36 +528,56 @@ class KillSwitchConnectionHandler:
         kill_switch = KillSwitchConnection(
             general_config,
             ipv4_settings=None,
-            ipv6_settings=self._ipv6_ks_settings,
+            ipv6_settings=self._get_ipv6_ks_settings(),
         )
 
-        await _wrap_future(
-            self.nm_client.add_connection_async(kill_switch.connection, save_to_disk=False)
+        connection = await _wrap_future(
+            self.nm_client.get_active_connection_async(conn_id=connection_id)
         )
+
+        if connection:
+            await self._update_connection_if_outdated(connection_id, kill_switch)
+            logger.debug("IPv6 leak protection already present.")
+            return
+
+        await self._add_connection(kill_switch, save_to_disk=False)
         logger.debug("IPv6 leak protection added.")
 
-    async def remove_full_killswitch_connection(self):
-        """Removes full kill switch connection."""
+    @_measured
+    async def remove_full_killswitch_connection(self, keep_permanent_profile: bool = False):
+        """Removes full kill switch connection.
+
+        :param keep_permanent_profile: whether the permanent full kill switch
+            connection should just be deactivated, keeping its profile on disk
+            to be reactivated later. It only has effect when the handler was
+            created with `reuse_permanent_connection` enabled.
+        """
         logger.debug("Removing full kill switch...")
-        await self._remove_connection(
-            _get_connection_id(self._connection_prefix, permanent=True)
-        )
-        await self._remove_connection(
-            _get_connection_id(self._connection_prefix, permanent=False)
-        )
+        permanent_connection_id = _get_connection_id(self._connection_prefix, permanent=True)
+        connection_id = _get_connection_id(self._connection_prefix, permanent=False)
+        await self.run_batch({
+            permanent_connection_id: self._remove_connection(
+                permanent_connection_id,
+                keep_profile=keep_permanent_profile and self._reuse_permanent_connection
+            ),
+            connection_id: self._remove_connection(connection_id),
+        }, raise_first_error=True)
         logger.debug("Full kill switch removed.")
 
+    @_measured
     async def remove_routed_killswitch_connection(self):
         """Removes routed kill switch connection."""
         logger.debug("Removing routed kill switch...")
-        await self._remove_connection(
-            _get_connection_id(self._connection_prefix, permanent=True, routed=True)
-        )
-        await self._remove_connection(
-            _get_connection_id(self._connection_prefix, permanent=False, routed=True)
-        )
+        await self.run_batch({
+            connection_id: self._remove_connection(connection_id)
+            for connection_id in (
+                _get_connection_id(self._connection_prefix, permanent=True, routed=True),
+                _get_connection_id(self._connection_prefix, permanent=False, routed=True)
+            )
+        }, raise_first_error=True)
         logger.debug("Routed kill switch removed.")
 
+    @_measured
     async def remove_ipv6_leak_protection(self):
         """Removes IPv6 kill switch connection."""
         logger.debug("Removing IPv6 leak protection...")
@@ -229,9 +586,231 @@ class KillSwitchConnectionHandler:
         )
         logger.debug("IP6 leak protection removed.")
 
-    async def _remove_connection(self, connection_id: str):
-        connection = self.nm_client.get_connection(
-            conn_id=connection_id)
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Runs the kill switch operations within the context as a transaction.
+
+        A NetworkManager checkpoint is created when entering the context. If an
+        exception is raised within it, NetworkManager rolls back to the
+        checkpoint, restoring the previous connections in a single daemon-side
+        operation, and the exception is re-raised. Otherwise, the checkpoint
+        is destroyed, keeping the changes.
+
+        If the user is not allowed to create checkpoints, or the checkpoint
+        could not be created, the operations are run without transaction.
+        Note that checkpoints are only created when NetworkManager grants the
+        permission without asking for authentication (see
+        `NMCheckpoints.can_create`), which polkit does not do by default for
+        regular desktop users.
+
+        :raises RuntimeError: if the checkpoint could not be destroyed after
+            the operations succeeded. Their changes are then rolled back, so
+            that they are not silently reverted by NetworkManager once
+            `CHECKPOINT_ROLLBACK_TIMEOUT` expires.
+        """
+        checkpoint = await self._create_checkpoint()
+        try:
+            yield
+        except BaseException:
+            if checkpoint:
+                await self._rollback_checkpoint(checkpoint)
+            raise
+
+        if checkpoint:
+            await self._destroy_checkpoint(checkpoint)
+
+    async def _create_checkpoint(self):
+        if not self.nm_client.checkpoints.can_create():
+            logger.info("Not allowed to create checkpoints: running without transaction.")
+            return None
+
+        try:
+            return await _wrap_future(
+                self.nm_client.checkpoints.create_async(CHECKPOINT_ROLLBACK_TIMEOUT),
+                timeout=self._get_timeout("checkpoint_create")
+            )
+        except (RuntimeError, asyncio.TimeoutError):
+            logger.warning(
+                "Checkpoint could not be created: running without transaction.", exc_info=True
+            )
+            return None
+
+    async def _rollback_checkpoint(self, checkpoint):
+        try:
+            await _wrap_future(
+                self.nm_client.checkpoints.rollback_async(checkpoint),
+                timeout=self._get_timeout("checkpoint_rollback")
+            )
+            logger.info("Kill switch transaction rolled back.")
+        except (RuntimeError, asyncio.TimeoutError):
+            # NetworkManager rolls back automatically once the rollback timeout expires.
+            logger.error("Checkpoint could not be rolled back.", exc_info=True)
+
+    async def _destroy_checkpoint(self, checkpoint):
+        error = None
+        for attempt in range(1, CHECKPOINT_DESTROY_ATTEMPTS + 1):
+            try:
+                await _wrap_future(
+                    self.nm_client.checkpoints.destroy_async(checkpoint),
+                    timeout=self._get_timeout("checkpoint_destroy")
+                )
+                return
+            except (RuntimeError, asyncio.TimeoutError) as exc:
+                logger.warning(
+                    f"Checkpoint could not be destroyed (attempt {attempt}).", exc_info=True
+                )
+                error = exc
+
+        # Otherwise, the changes would stay in place until NetworkManager
+        # rolls them back once the rollback timeout expires.
+        await self._rollback_checkpoint(checkpoint)
+        raise RuntimeError(
+            "Checkpoint could not be destroyed: the kill switch changes were rolled back."
+        ) from error
+
+    @_measured
+    async def reconcile(
+            self, desired_connection_ids: Iterable[str] = ()
+    ) -> List[OperationResult]:
+        """Removes the kill switch connections which are not desired, e.g. the
+        ones left behind after a crash, in a single scan.
+
+        All connections are listed once and the ones matching the kill switch
+        connection IDs, with this handler prefix, and interface names are
+        removed concurrently, except for the desired ones. Duplicated
+        connections sharing a desired ID are removed too, except for the
+        active one or, if none of them is active, the first one found.
+
+        :param desired_connection_ids: IDs of the kill switch connections to keep.
+        :return: the result of each removal, named after the connection ID and
+            UUID. Errors are not raised but returned in the results.
+        """
+        desired_connection_ids = set(desired_connection_ids)
+        connections = [
+            connection
+            for connection in await _wrap_future(self.nm_client.get_connections_async())
+            if _is_killswitch_connection(self._connection_prefix, connection)
+        ]
+
+        # UUID of the connection kept for each desired ID.
+        kept_uuids = {}
+        for connection_id in desired_connection_ids:
+            active_connection = await _wrap_future(
+                self.nm_client.get_active_connection_async(conn_id=connection_id)
+            )
+            if active_connection:
+                kept_uuids[connection_id] = active_connection.get_uuid()
+        for connection in connections:
+            if connection.get_id() in desired_connection_ids:
+                kept_uuids.setdefault(connection.get_id(), connection.get_uuid())
+
+        removals = {}
+        for connection in connections:
+            connection_id = connection.get_id()
+            if kept_uuids.get(connection_id) == connection.get_uuid():
+                continue
+
+            removals[f"{connection_id} ({connection.get_uuid()})"] = _wrap_future(
+                self.nm_client.remove_connection_async(connection),
+                timeout=self._get_timeout("remove_connection")
+            )
+
+        results = await self.run_batch(removals)
+        for result in results:
+            if result.succeeded:
+                logger.info(f"Orphaned kill switch connection {result.name} removed.")
+            else:
+                logger.warning(
+                    f"Orphaned kill switch connection {result.name} could not be removed: "
+                    f"{result.error!r}"
+                )
+
+        return results
+
+    async def run_batch(
+            self, operations: Mapping[str, Awaitable], raise_first_error: bool = False
+    ) -> List[OperationResult]:
+        """Runs the specified operations concurrently.
+
+        Operations are expected to act on independent kill switch interfaces,
+        for example removing the full and the routed kill switch connections,
+        so that they can be run at the same time.
+
+        :param operations: operations to be run, by name.
+        :param raise_first_error: whether the error of the first operation
+            that failed, in the order the operations were specified, should be
+            raised once all of them are done.
+        :return: the result of each operation, in the same order the operations
+            were specified. Unless `raise_first_error` is set, errors are not
+            raised but returned in the results.
+        """
+        names = list(operations)
+        results = await asyncio.gather(
+            *(operations[name] for name in names), return_exceptions=True
+        )
+        results = [
+            OperationResult(name=name, error=result)
+            if isinstance(result, BaseException) else OperationResult(name=name, result=result)
+            for name, result in zip(names, results)
+        ]
+        if raise_first_error:
+            for result in results:
+                if not result.succeeded:
+                    raise result.error
+
+        return results
+
+    async def _add_connection(self, kill_switch: KillSwitchConnection, save_to_disk: bool):
+        connection = kill_switch.connection
+        _mark_phase("build_profile")
+        await _wrap_future(
+            self.nm_client.add_connection_async(connection, save_to_disk=save_to_disk),
+            timeout=self._get_timeout("add_connection")
+        )
+        _mark_phase("add_connection")
+
+    async def _update_connection_if_outdated(
+            self, connection_id: str, kill_switch: KillSwitchConnection
+    ) -> bool:
+        """
+        Updates the active connection with the specified ID in place, unless
+        it was created with the same settings as the specified kill switch.
+
+        :return: True if the connection has the settings of the kill switch,
+            either because it already had them or because it was updated.
+            Otherwise, False.
+        """
+        connection = await _wrap_future(
+            self.nm_client.get_connection_async(conn_id=connection_id)
+        )
+        if not connection:
+            return False
+
+        if _has_same_settings(connection, kill_switch):
+            return True
+
+        try:
+            await _wrap_future(
+                self.nm_client.update_connection_async(connection, kill_switch.connection),
+                timeout=self._get_timeout("update_connection")
+            )
+        except (RuntimeError, asyncio.TimeoutError):
+            # The connection is still active, just with its previous settings.
+            logger.warning(f"{connection_id} could not be updated.", exc_info=True)
+            return False
+        _mark_phase("update_connection")
+        logger.debug(f"{connection_id} updated with the new settings.")
+        return True
+
+    async def _remove_connection(self, connection_id: str, keep_profile: bool = False):
+        if keep_profile:
+            await self._deactivate_connection(connection_id)
+            return
+
+        connection = await _wrap_future(
+            self.nm_client.get_connection_async(conn_id=connection_id)
+        )
 
         logger.debug(f"Attempting to remove {connection_id}: {connection}")
 
@@ -239,9 +818,36 @@ class KillSwitchConnectionHandler:
             logger.debug(f"There was no {connection_id} to remove")
             return
 
-        await _wrap_future(self.nm_client.remove_connection_async(connection))
+        await _wrap_future(
+            self.nm_client.remove_connection_async(connection),
+            timeout=self._get_timeout("remove_connection")
+        )
+        _mark_phase("remove_connection")
+
+    async def _deactivate_connection(self, connection_id: str):
+        active_connection = await _wrap_future(
+            self.nm_client.get_active_connection_async(conn_id=connection_id)
+        )
+
+        logger.debug(f"Attempting to deactivate {connection_id}: {active_connection}")
+
+        if not active_connection:
+            logger.debug(f"There was no {connection_id} to deactivate")
+            return
+
+        await _wrap_future(
+            self.nm_client.deactivate_connection_async(active_connection),
+            timeout=self._get_timeout("deactivate_connection")
+        )
+        _mark_phase("deactivate_connection")
 
     async def _ensure_connectivity_check_is_disabled(self):
-        if self.is_connectivity_check_enabled:
-            await _wrap_future(self.nm_client.disable_connectivity_check())
+        # The connectivity check state is cached by the client, so this does not block.
+        if self.nm_client.connectivity_check_get_enabled():
+            await _wrap_future(
+                self.nm_client.disable_connectivity_check(),
+                timeout=self._get_timeout("disable_connectivity_check")
+            )
             logger.info("Network connectivity check was disabled.")
+
+        _mark_phase("connectivity_check")
@@ -0,0 +1,90 @@
+"""
+This module contains the snapshot of the kill switch status.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+MODE_FULL = "full"
+MODE_ROUTED = "routed"
+MODE_IPV6_LEAK_PROTECTION = "ipv6_leak_protection"
+
+STATE_ACTIVATED = "activated"
+
+
+@dataclass(frozen=True)
+class KillSwitchConnectionStatus:
+    """Status of an active kill switch connection."""
+    connection_id: str
+    mode: str  # MODE_FULL, MODE_ROUTED or MODE_IPV6_LEAK_PROTECTION.
+    permanent: bool
+    state: str  # NM.ActiveConnectionState nick (e.g. "activating" or "activated").
+    since: float  # Time of the last state change, in seconds since the epoch.
+
+    @property
+    def activated(self) -> bool:
+        """Returns whether the connection is fully activated."""
+        return self.state == STATE_ACTIVATED
+
+
+@dataclass(frozen=True)
+class KillSwitchStatus:
+    """Immutable snapshot of the kill switch status."""
+    connections: Tuple[KillSwitchConnectionStatus, ...] = ()
+
+    @property
+    def enabled(self) -> bool:
+        """Returns whether the full or the routed kill switch is active."""
+        return self.mode is not None
+
+    @property
+    def mode(self) -> Optional[str]:
+        """
+        Returns the kill switch mode: MODE_FULL or MODE_ROUTED, or None if
+        it's not enabled. While switching modes both connections can be
+        active, in which case the full one is reported since it prevails.
+        """
+        modes = {connection.mode for connection in self.connections}
+        for mode in (MODE_FULL, MODE_ROUTED):
+            if mode in modes:
+                return mode
+
+        return None
+
+    @property
+    def permanent(self) -> bool:
+        """Returns whether the kill switch connection in use is permanent."""
+        return any(
+            connection.permanent for connection in self.connections
+            if connection.mode == self.mode
+        )
+
+    @property
+    def ipv6_leak_protection(self) -> bool:
+        """Returns whether IPv6 leak protection is active."""
+        return any(
+            connection.mode == MODE_IPV6_LEAK_PROTECTION for connection in self.connections
+        )
+
+    def get_connection(self, mode: str) -> Optional[KillSwitchConnectionStatus]:
+        """Returns the status of the active connection for the specified mode, if any."""
+        return next(
+            (connection for connection in self.connections if connection.mode == mode), None
+        )
@@ -0,0 +1,202 @@
+"""
+This module contains the instrumentation used to measure how long
+kill switch operations take.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from bisect import bisect_left
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from threading import Lock
+import asyncio
+import time
+
+OUTCOME_SUCCESS = "success"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_ERROR = "error"
+
+# Upper bounds, in seconds, of the histogram buckets.
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float("inf"))
+
+
+class MetricsSink:
+    """
+    Receives the metrics of kill switch operations.
+
+    This default implementation discards all metrics. Subclasses can override
+    any of the methods to forward them to their own metrics system. Note that
+    methods might be called from both the asyncio and the GLib loop threads.
+    """
+    def record_phase(
+            self, operation: str, phase: str, started_at: float, ended_at: float
+    ):  # pylint: disable=unused-argument
+        """
+        Records that a phase of an operation finished.
+        :param operation: name of the operation (e.g. "add_connection").
+        :param phase: name of the phase (e.g. "device_added").
+        :param started_at: monotonic timestamp when the phase started.
+        :param ended_at: monotonic timestamp when the phase ended.
+        """
+
+    def record_outcome(
+            self, operation: str, outcome: str, duration: float
+    ):  # pylint: disable=unused-argument
+        """
+        Records that an operation finished.
+        :param operation: name of the operation.
+        :param outcome: one of OUTCOME_SUCCESS, OUTCOME_TIMEOUT or OUTCOME_ERROR.
+        :param duration: time, in seconds, the operation took.
+        """
+
+
+class _Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS)
+
+    def add(self, value: float):
+        """Adds a value, in seconds, to the histogram."""
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.buckets[bisect_left(HISTOGRAM_BUCKETS, value)] += 1
+
+    def to_dict(self) -> dict:
+        """Returns the histogram as a dict, with the count of values by bucket upper bound."""
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "buckets": dict(zip(HISTOGRAM_BUCKETS, self.buckets)),
+        }
+
+
+class InMemoryMetricsCollector(MetricsSink):
+    """
+    Metrics sink keeping histograms of phase and operation durations,
+    operation outcome counters and the most recent phase timestamps in memory.
+    """
+    def __init__(self, max_events: int = 1000):
+        self._lock = Lock()
+        self._phases = defaultdict(_Histogram)
+        self._operations = defaultdict(_Histogram)
+        self._outcomes = defaultdict(lambda: defaultdict(int))
+        self._events = deque(maxlen=max_events)
+
+    def record_phase(self, operation: str, phase: str, started_at: float, ended_at: float):
+        with self._lock:
+            self._phases[(operation, phase)].add(ended_at - started_at)
+            self._events.append((operation, phase, started_at, ended_at))
+
+    def record_outcome(self, operation: str, outcome: str, duration: float):
+        with self._lock:
+            self._operations[operation].add(duration)
+            self._outcomes[operation][outcome] += 1
+
+    def dump(self) -> dict:
+        """Returns a snapshot of all the collected metrics."""
+        with self._lock:
+            return {
+                "phases": {
+                    f"{operation}.{phase}": histogram.to_dict()
+                    for (operation, phase), histogram in self._phases.items()
+                },
+                "operations": {
+                    operation: histogram.to_dict()
+                    for operation, histogram in self._operations.items()
+                },
+                "outcomes": {
+                    operation: dict(outcomes)
+                    for operation, outcomes in self._outcomes.items()
+                },
+                "events": list(self._events),
+            }
+
+    def reset(self):
+        """Discards all the collected metrics."""
+        with self._lock:
+            self._phases.clear()
+            self._operations.clear()
+            self._outcomes.clear()
+            self._events.clear()
+
+
+class OperationTimer:
+    """
+    Measures the phases of an operation. Each phase is assumed to start when
+    the previous one ended, or when the operation started for the first one.
+    """
+    def __init__(self, sink: MetricsSink, operation: str):
+        self._sink = sink
+        self._operation = operation
+        self._started_at = self._last_mark = time.monotonic()
+        self._finished = False
+
+    def mark(self, phase: str):
+        """Records that the specified phase just ended."""
+        now = time.monotonic()
+        self._sink.record_phase(self._operation, phase, self._last_mark, now)
+        self._last_mark = now
+
+    def finish(self, outcome: str):
+        """Records the outcome of the operation. Only the first call has effect."""
+        if self._finished:
+            return
+
+        self._finished = True
+        self._sink.record_outcome(
+            self._operation, outcome, time.monotonic() - self._started_at
+        )
+
+    def finish_with_future(self, future):
+        """Records the outcome of the operation once the specified future is done."""
+        def _on_done(done_future):
+            if done_future.cancelled():
+                self.finish(OUTCOME_TIMEOUT)
+            elif done_future.exception():
+                self.finish(OUTCOME_ERROR)
+            else:
+                self.finish(OUTCOME_SUCCESS)
+
+        future.add_done_callback(_on_done)
+
+
+@contextmanager
+def measure(sink: MetricsSink, operation: str):
+    """
+    Context manager measuring the operation run within it, which is considered
+    successful unless an exception is raised.
+    :return: the timer, to be able to mark the phases of the operation.
+    """
+    timer = OperationTimer(sink, operation)
+    try:
+        yield timer
+    except asyncio.TimeoutError:
+        timer.finish(OUTCOME_TIMEOUT)
+        raise
+    except BaseException:
+        timer.finish(OUTCOME_ERROR)
+        raise
+
+    timer.finish(OUTCOME_SUCCESS)
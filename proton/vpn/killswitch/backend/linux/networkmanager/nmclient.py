@@ -19,9 +19,10 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
 """
-from concurrent.futures import Future
-from threading import Thread, Lock
-from typing import Optional
+import asyncio
+from concurrent.futures import Future, wait
+from threading import Thread, Lock, current_thread
+from typing import Callable, Mapping, Optional, Tuple, Union
 
 from packaging.version import Version
 
@@ -30,25 +31,57 @@ gi.require_version("NM", "1.0")
 from gi.repository import NM, GLib, Gio, GObject  # pylint: disable=C0413 # noqa: E402
 
 from proton.vpn import logging  # noqa: E402 pylint: disable=wrong-import-position
+# pylint: disable-next=wrong-import-position
+from proton.vpn.killswitch.backend.linux.networkmanager.checkpoints import (  # noqa: E402
+    NMCheckpoints
+)
+# pylint: disable-next=wrong-import-position
+from proton.vpn.killswitch.backend.linux.networkmanager.device_signals import (  # noqa: E402
+    DeviceSignalDispatcher
+)
+# pylint: disable-next=wrong-import-position
+from proton.vpn.killswitch.backend.linux.networkmanager.futures import (  # noqa: E402
+    chain_exception, chain_future, create_future, create_resolved_future,
+    set_future_exception, set_future_result
+)
+# pylint: disable-next=wrong-import-position
+from proton.vpn.killswitch.backend.linux.networkmanager.metrics import (  # noqa: E402
+    MetricsSink, OperationTimer
+)
+# pylint: disable-next=wrong-import-position
+from proton.vpn.killswitch.backend.linux.networkmanager.object_index import (  # noqa: E402
+    NMObjectIndex
+)
 
 logger = logging.getLogger(__name__)
 
 
-def _create_future():
-    """Creates a future and sets its internal state as running."""
-    future = Future()
-    future.set_running_or_notify_cancel()
-    return future
-
-
 class NMClient:
     """
     Wrapper over the NetworkManager client.
-    It also starts the GLib main loop used by the NetworkManager client.
+
+    By default, it also starts the GLib main loop used by the NetworkManager
+    client, on a dedicated thread, and operations return concurrent futures
+    resolved from that thread. Alternatively, the client can be attached
+    to a GLib main context already iterated by the host application
+    (see `NMClient.start`), or run directly on an asyncio loop driven by
+    GLib, in which case operations return asyncio futures
+    (see `NMClient.start_on_asyncio_loop`).
     """
     _lock = Lock()
+    _loop = None  # asyncio loop the client runs on, when using the asyncio engine.
     _main_context = None
+    _main_loop = None
+    _loop_thread = None
     _nm_client = None
+    _index = None
+    _device_dispatcher = None
+    _pending_operations = set()
+    # Connectivity check state, kept up to date with property notifications.
+    _connectivity_check_enabled = None
+    # Disabling of the connectivity check in flight, shared by concurrent callers.
+    _connectivity_check_lock = Lock()
+    _disable_connectivity_check_future = None
 
     @classmethod
     def initialize_nm_client_singleton(cls):
@@ -66,35 +99,163 @@ class NMClient:
         if cls._nm_client:
             return
 
+        cls.start()
+
+    @classmethod
+    def start(cls, main_context: GLib.MainContext = None):
+        """
+        Starts the NetworkManager client singleton, if it wasn't started yet.
+
+        :param main_context: GLib main context, already iterated by the host
+            application (e.g. `GLib.MainContext.default()` in GTK apps), to
+            attach the NetworkManager client to. Calls made from the thread
+            iterating it then run directly instead of being handed off to
+            another thread. When not specified, a new main context is created
+            and iterated by a dedicated thread.
+        """
         with cls._lock:
             if not cls._nm_client:
-                cls._initialize_nm_client_singleton()
+                cls._initialize_nm_client_singleton(main_context)
 
     @classmethod
-    def _initialize_nm_client_singleton(cls):
-        cls._main_context = GLib.MainContext()
+    def start_on_asyncio_loop(cls):
+        """
+        Starts the NetworkManager client singleton on the running asyncio loop,
+        if it wasn't started yet.
+
+        The asyncio loop must be the one provided by PyGObject's GLib event loop
+        integration (`gi.events.GLibEventLoopPolicy`, available since PyGObject
+        3.50), which iterates a GLib main context. The NetworkManager client is
+        attached to that main context, so no GLib loop thread is started and
+        NM callbacks resolve asyncio futures directly. The client must then
+        only be used from the thread running the asyncio loop.
+
+        :raises RuntimeError: if there is no running asyncio loop or if it's
+            not driven by GLib. In that case, the default threaded engine
+            (`NMClient.start`) can be used instead.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            from gi.events import GLibEventLoop  # pylint: disable=import-outside-toplevel
+        except ImportError as exc:
+            raise RuntimeError(
+                "GLib asyncio integration requires PyGObject 3.50 or newer."
+            ) from exc
+
+        if not isinstance(loop, GLibEventLoop):
+            raise RuntimeError(
+                "The running asyncio loop is not driven by GLib: "
+                "gi.events.GLibEventLoopPolicy should be used."
+            )
 
-        # Setting daemon=True when creating the thread makes that this thread
-        # exits abruptly when the python process exits. It would be better to
-        # exit the thread running the main loop calling self._main_loop.quit().
-        Thread(target=cls._run_glib_loop, daemon=True).start()
+        with cls._lock:
+            if cls._nm_client:
+                return
+
+            cls._loop = loop
+            try:
+                # The GLib loop driving the asyncio loop iterates the thread default context.
+                cls._initialize_nm_client_singleton(GLib.MainContext.ref_thread_default())
+            except BaseException:
+                cls._loop = None
+                raise
+
+    @classmethod
+    def shutdown(cls, timeout: float = 5):
+        """
+        Stops the NetworkManager client singleton, if it was started.
+
+        Operations in flight are given up to `timeout` seconds to complete
+        before being cancelled. Then the work already queued on the GLib main
+        context is dispatched and, if the main loop was started by NMClient,
+        it's quit and its thread is joined. Otherwise, the main context is
+        just detached. The client can be started again afterwards.
+
+        :param timeout: time, in seconds, to wait for operations in flight.
+        """
+        with cls._lock:
+            if not cls._nm_client:
+                return
+
+            pending_operations = list(cls._pending_operations)
+            # Waiting from the thread iterating the main context would block
+            # the operations, which complete on that same thread. Asyncio
+            # futures can't be waited for from other threads either.
+            if pending_operations and not cls._loop and not cls._main_context.is_owner():
+                wait(pending_operations, timeout=timeout)
+            for future in pending_operations:
+                future.cancel()
+
+            if cls._main_loop:
+                # The low priority makes sure the work already queued
+                # (e.g. cancellations) is dispatched before quitting the loop.
+                cls._main_context.invoke_full(
+                    priority=GLib.PRIORITY_LOW, function=cls._main_loop.quit
+                )
+                if cls._loop_thread is not current_thread():
+                    cls._loop_thread.join(timeout=timeout)
+
+            cls._loop = None
+            cls._main_context = None
+            cls._main_loop = None
+            cls._loop_thread = None
+            cls._nm_client = None
+            cls._index = None
+            cls._device_dispatcher = None
+            cls._connectivity_check_enabled = None
+            cls._disable_connectivity_check_future = None
+
+    @classmethod
+    def _initialize_nm_client_singleton(cls, main_context: GLib.MainContext = None):
+        if main_context:
+            cls._main_context = main_context
+        else:
+            cls._main_context = GLib.MainContext()
+            cls._main_loop = GLib.MainLoop(cls._main_context)
+            # Setting daemon=True when creating the thread makes that this thread
+            # exits abruptly when the python process exits, in case `shutdown`
+            # was not called.
+            cls._loop_thread = Thread(target=cls._run_glib_loop, daemon=True)
+            cls._loop_thread.start()
 
         def _init_nm_client():
             # It's important the NM.Client instance is created in the thread
-            # running the GLib event loop so that then that's the thread used
-            # for all GLib asynchronous operations.
-            return NM.Client.new(cancellable=None)
+            # running the GLib event loop, with its main context as the thread
+            # default one, so that then that's the thread used for all GLib
+            # asynchronous operations.
+            cls._main_context.push_thread_default()
+            try:
+                nm_client = NM.Client.new(cancellable=None)
+            finally:
+                cls._main_context.pop_thread_default()
+
+            cls._index = NMObjectIndex()
+            cls._index.attach(nm_client)
+            cls._device_dispatcher = DeviceSignalDispatcher()
+            cls._device_dispatcher.attach(nm_client)
+            cls._connectivity_check_enabled = nm_client.connectivity_check_get_enabled()
+            nm_client.connect(
+                "notify::connectivity-check-enabled", cls._on_connectivity_check_enabled_changed
+            )
+            return nm_client
 
         cls._nm_client = cls._run_on_glib_loop_thread(_init_nm_client).result()
 
+    @classmethod
+    def _on_connectivity_check_enabled_changed(cls, nm_client, _param_spec):
+        cls._connectivity_check_enabled = nm_client.connectivity_check_get_enabled()
+
     @classmethod
     def _run_glib_loop(cls):
-        main_loop = GLib.MainLoop(cls._main_context)
-        cls._main_context.push_thread_default()
-        main_loop.run()
+        main_context, main_loop = cls._main_context, cls._main_loop
+        main_context.push_thread_default()
+        try:
+            main_loop.run()
+        finally:
+            main_context.pop_thread_default()
 
     @classmethod
-    def _assert_running_on_glib_loop_thread(cls):
+    def _assert_running_on_glib_loop_thread(cls, main_context: GLib.MainContext = None):
         """
         This method asserts that the thread running it is the one iterating
         GLib's main loop.
@@ -105,104 +266,261 @@ class NMClient:
 
         For more info:
         https://developer.gnome.org/documentation/tutorials/main-contexts.html#checking-threading
+
+        :param main_context: main context to check. By default, the one
+            the client is currently attached to.
         """
-        if not cls._main_context.is_owner():
+        if not (main_context or cls._main_context).is_owner():
             raise RuntimeError("Code being run outside GLib's main loop.")
 
+    @classmethod
+    def _create_future(cls) -> Union[Future, asyncio.Future]:
+        """
+        Creates a future to be resolved from the GLib loop: an asyncio future
+        with the asyncio engine, otherwise a concurrent future in running state.
+        """
+        if cls._loop:
+            return cls._loop.create_future()
+
+        return create_future()
+
+    @classmethod
+    def _create_resolved_future(cls, result=None) -> Union[Future, asyncio.Future]:
+        """Creates a future which is already resolved with the specified result."""
+        if cls._loop:
+            future = cls._loop.create_future()
+            future.set_result(result)
+            return future
+
+        return create_resolved_future(result)
+
     @classmethod
     def _run_on_glib_loop_thread(cls, function, *args, **kwargs) -> Future:
-        future = _create_future()
+        future = cls._create_future()
+        # Work queued on shutdown (e.g. cancellations) runs once the client
+        # was already detached from the main context.
+        main_context = cls._main_context
 
         def wrapper():
-            cls._assert_running_on_glib_loop_thread()
+            cls._assert_running_on_glib_loop_thread(main_context)
             try:
                 future.set_result(function(*args, **kwargs))
             except BaseException as exc:  # pylint: disable=broad-except
                 future.set_exception(exc)
 
-        cls._main_context.invoke_full(priority=GLib.PRIORITY_DEFAULT, function=wrapper)
+        main_context.invoke_full(priority=GLib.PRIORITY_DEFAULT, function=wrapper)
 
         return future
 
-    def __init__(self):
+    def __init__(self, metrics: MetricsSink = None):
+        """
+        :param metrics: sink receiving the latency metrics of the operations
+            run with this client.
+        """
         self.initialize_nm_client_singleton()
+        self._metrics = metrics or MetricsSink()
 
-    def add_connection_async(
-        self, connection: NM.Connection, save_to_disk: bool = False
-    ) -> Future:
+    def _create_operation_future(self) -> Tuple[Future, Gio.Cancellable]:
         """
-        Adds a new connection asynchronously.
-        https://lazka.github.io/pgi-docs/#NM-1.0/classes/Client.html#NM.Client.add_connection_async
-        :param connection: connection to be added.
-        :return: a Future to keep track of completion.
+        Creates the future tracking an NM operation, together with the
+        Gio.Cancellable to be passed to the operation.
+
+        Contrary to other futures, the one returned is left in pending state,
+        so that it can be cancelled. For example, asyncio cancels it when
+        awaiting it times out. When that happens, the cancellable is cancelled
+        on the GLib loop thread, so that NM stops the operation, and the
+        signal handlers monitoring it are disconnected.
         """
-        future_conn_activated = _create_future()
+        future = self._loop.create_future() if self._loop else Future()
+        cancellable = Gio.Cancellable()
+        # Operations are tracked so that they can be waited for on shutdown.
+        self._pending_operations.add(future)
+
+        def _on_done(done_future: Future):
+            self._pending_operations.discard(done_future)
+            if done_future.cancelled():
+                self._run_on_glib_loop_thread(cancellable.cancel)
+
+        future.add_done_callback(_on_done)
+        return future, cancellable
+
+    def _wait_for_device_signal(
+            self, signal: str, interface_name: str,
+            callback: Callable[[NM.Device], None], future: Future
+    ):
+        """
+        Calls the callback each time the device signal is emitted for the
+        specified interface, until the future is done.
+
+        This method must be called from the GLib loop thread.
+        """
+        self._device_dispatcher.add_waiter(signal, interface_name, callback)
+        future.add_done_callback(
+            lambda _: self._run_on_glib_loop_thread(
+                self._device_dispatcher.remove_waiter, signal, interface_name, callback
+            )
+        )
 
-        def _on_interface_state_changed(_device, new_state, _old_state, _reason):
+    def _disconnect_when_done(self, future: Future, gobject: GObject.Object, handler_id: int):
+        """Disconnects the signal handler from the GLib loop thread once the future is done."""
+        future.add_done_callback(
+            lambda _: self._run_on_glib_loop_thread(
+                GObject.signal_handler_disconnect, gobject, handler_id
+            )
+        )
+
+    def _monitor_interface_activation(
+            self, interface_name: str, future: Future, timer: OperationTimer,
+            connection_uuid: str
+    ) -> Callable[[], None]:
+        """
+        Resolves the future as soon as the specified interface is added, or
+        found already existing, and reaches the activated state with the
+        specified connection.
+
+        This method must be called from the GLib loop thread.
+        :return: a function checking if the interface already exists, to be
+            called once NM started activating the connection. No device-added
+            signal is emitted when the device already exists (e.g. left over
+            from a previous profile), so otherwise the future would never resolve.
+        """
+        monitored_devices = set()
+
+        def _is_other_connection_active(device):
+            active_connection = device.get_active_connection()
+            return bool(active_connection and active_connection.get_uuid() != connection_uuid)
+
+        def _on_interface_state_changed(device, new_state, _old_state, _reason):
             """
             Monitors kill switch interface state changes and resolves
             the future as soon as the interface reaches the activated state
             """
             logger.debug(
-                f"{connection.get_interface_name()} interface state changed "
+                f"{interface_name} interface state changed "
                 f"to {NM.DeviceState(new_state).value_name}"
             )
             if (
                     NM.DeviceState(new_state) == NM.DeviceState.ACTIVATED
-                    and not future_conn_activated.done()
+                    and not _is_other_connection_active(device)
+                    and not future.done()
+            ):
+                timer.mark("device_activated")
+                set_future_result(future)
+
+        def _monitor_device(device, phase):
+            if device in monitored_devices:
+                return
+
+            monitored_devices.add(device)
+            timer.mark(phase)
+            handler_id = device.connect("state-changed", _on_interface_state_changed)
+            self._disconnect_when_done(future, device, handler_id)
+
+            active_connection = device.get_active_connection()
+            if (
+                    device.get_state() == NM.DeviceState.ACTIVATED
+                    and active_connection
+                    and active_connection.get_uuid() == connection_uuid
+                    and not future.done()
             ):
-                future_conn_activated.set_result(None)
+                timer.mark("device_activated")
+                set_future_result(future)
 
-        def _on_interface_added(_nm_client, device):
+        def _on_interface_added(device):
             """
             Monitors interface creation. As soon as the kill switch interface
             is created it sets up the call back to monitor interface state changes.
             """
             logger.debug(
-                f"{device.get_iface()} interface added in state {device.get_state().value_name}"
+                f"{interface_name} interface added in state {device.get_state().value_name}"
             )
-            if not device.get_iface() == connection.get_interface_name():
-                return
+            _monitor_device(device, "device_added")
 
-            handler_id = device.connect("state-changed", _on_interface_state_changed)
-            future_conn_activated.add_done_callback(
-                lambda f: self._run_on_glib_loop_thread(
-                    GObject.signal_handler_disconnect, device, handler_id
-                ).result()
-            )
+        def _check_existing_interface():
+            device = self._index.get_device(interface_name)
+            if device and not future.done():
+                logger.debug(
+                    f"{interface_name} interface found in state {device.get_state().value_name}"
+                )
+                _monitor_device(device, "device_found")
 
-        def _on_connection_added(nm_client, res, _user_data):
+        self._wait_for_device_signal(
+            DeviceSignalDispatcher.DEVICE_ADDED, interface_name, _on_interface_added, future
+        )
+
+        return _check_existing_interface
+
+    def _monitor_interface_removal(
+            self, interface_name: str, future: Future, timer: OperationTimer
+    ):
+        """
+        Resolves the future as soon as the specified interface is removed.
+
+        This method must be called from the GLib loop thread.
+        """
+        def _on_interface_removed(_device):
+            logger.debug(f"{interface_name} was removed.")
+            if not future.done():
+                timer.mark("device_removed")
+                set_future_result(future)
+
+        self._wait_for_device_signal(
+            DeviceSignalDispatcher.DEVICE_REMOVED, interface_name, _on_interface_removed, future
+        )
+
+    def add_connection_async(
+        self, connection: NM.Connection, save_to_disk: bool = False
+    ) -> Future:
+        """
+        Adds a new connection asynchronously.
+        https://lazka.github.io/pgi-docs/#NM-1.0/classes/Client.html#NM.Client.add_connection_async
+        :param connection: connection to be added.
+        :return: a Future to keep track of completion. Cancelling it cancels
+            the operation.
+        """
+        future_conn_activated, cancellable = self._create_operation_future()
+        timer = OperationTimer(self._metrics, "add_connection")
+        timer.finish_with_future(future_conn_activated)
+
+        def _on_connection_added(nm_client, res, check_existing_interface):
             try:
                 # Make sure exceptions creating the connection are passed to the future.
                 nm_client.add_connection_finish(res)
             except Exception as exc:  # pylint: disable=broad-except
-                future_conn_activated.set_exception(
+                set_future_exception(
+                    future_conn_activated,
                     RuntimeError(
                         f"Error setting adding KS connection: {nm_client=}, {res=}"
                     ).with_traceback(exc.__traceback__)
                 )
                 return
 
+            timer.mark("add_connection_finish")
+            check_existing_interface()
+
         def _add_connection_async():
+            if future_conn_activated.done():
+                return  # The operation was cancelled before it started.
+
             # Set up interface connection monitoring, which resolves the future
             # once the kill switch is active.
-            handler_id = self._nm_client.connect("device-added", _on_interface_added)
-            future_conn_activated.add_done_callback(
-                lambda f: self._run_on_glib_loop_thread(
-                    GObject.signal_handler_disconnect, self._nm_client, handler_id
-                ).result()
+            check_existing_interface = self._monitor_interface_activation(
+                connection.get_interface_name(), future_conn_activated, timer,
+                connection.get_uuid()
             )
 
             # Add kill switch connection asynchronously.
             self._nm_client.add_connection_async(
                 connection=connection,
                 save_to_disk=save_to_disk,
-                cancellable=None,
+                cancellable=cancellable,
                 callback=_on_connection_added,
-                user_data=None
+                user_data=check_existing_interface
             )
 
-        self._run_on_glib_loop_thread(_add_connection_async).result()
+        chain_exception(
+            self._run_on_glib_loop_thread(_add_connection_async), future_conn_activated
+        )
 
         return future_conn_activated
 
@@ -213,83 +531,342 @@ class NMClient:
         Removes the specified connection asynchronously.
         https://lazka.github.io/pgi-docs/#NM-1.0/classes/RemoteConnection.html#NM.RemoteConnection.delete_async
         :param connection: connection to be removed.
-        :return: a Future to keep track of completion.
+        :return: a Future to keep track of completion. Cancelling it cancels
+            the operation.
         """
-        future_interface_removed = _create_future()
+        future_interface_removed, cancellable = self._create_operation_future()
+        timer = OperationTimer(self._metrics, "remove_connection")
+        timer.finish_with_future(future_interface_removed)
 
         def _on_connection_removed(connection, result, _user_data):
             try:
                 connection.delete_finish(result)
             except Exception as exc:  # pylint: disable=broad-except
-                future_interface_removed.set_exception(
+                set_future_exception(
+                    future_interface_removed,
                     RuntimeError(
                         f"Error removing KS connection: {connection=}, {result=}"
                     ).with_traceback(exc.__traceback__)
                 )
+                return
 
-        def _on_interface_removed(_nm_client, device):
-            logger.debug(
-                f"{device.get_iface()} was removed."
-            )
-            if device.get_iface() == connection.get_interface_name():
-                future_interface_removed.set_result(None)
+            timer.mark("delete_finish")
+            if not is_connection_active:
+                # There is no device to wait for.
+                set_future_result(future_interface_removed)
+
+        is_connection_active = False
 
         def _remove_connection_async():
-            handler_id = self._nm_client.connect("device-removed", _on_interface_removed)
-            future_interface_removed.add_done_callback(
-                lambda f: self._run_on_glib_loop_thread(
-                    GObject.signal_handler_disconnect, self._nm_client, handler_id
-                ).result()
+            nonlocal is_connection_active
+            if future_interface_removed.done():
+                return  # The operation was cancelled before it started.
+
+            # Inactive connections (e.g. orphaned or deactivated profiles)
+            # don't have a device which will be removed.
+            device = self._index.get_device(connection.get_interface_name())
+            active_connection = device.get_active_connection() if device else None
+            is_connection_active = bool(
+                active_connection and active_connection.get_uuid() == connection.get_uuid()
             )
+            if is_connection_active:
+                self._monitor_interface_removal(
+                    connection.get_interface_name(), future_interface_removed, timer
+                )
 
             connection.delete_async(
-                None,
+                cancellable,
                 _on_connection_removed,
                 None
             )
 
-        self._run_on_glib_loop_thread(_remove_connection_async).result()
+        chain_exception(
+            self._run_on_glib_loop_thread(_remove_connection_async), future_interface_removed
+        )
 
         return future_interface_removed
 
+    def activate_connection_async(self, connection: NM.RemoteConnection) -> Future:
+        """
+        Activates an existing connection asynchronously.
+        https://lazka.github.io/pgi-docs/#NM-1.0/classes/Client.html#NM.Client.activate_connection_async
+        :param connection: connection to be activated.
+        :return: a Future to keep track of completion. Cancelling it cancels
+            the operation.
+        """
+        future_conn_activated, cancellable = self._create_operation_future()
+        timer = OperationTimer(self._metrics, "activate_connection")
+        timer.finish_with_future(future_conn_activated)
+
+        def _on_connection_activated(nm_client, res, check_existing_interface):
+            try:
+                nm_client.activate_connection_finish(res)
+            except Exception as exc:  # pylint: disable=broad-except
+                set_future_exception(
+                    future_conn_activated,
+                    RuntimeError(
+                        f"Error activating KS connection: {nm_client=}, {res=}"
+                    ).with_traceback(exc.__traceback__)
+                )
+                return
+
+            timer.mark("activate_connection_finish")
+            check_existing_interface()
+
+        def _activate_connection_async():
+            if future_conn_activated.done():
+                return  # The operation was cancelled before it started.
+
+            check_existing_interface = self._monitor_interface_activation(
+                connection.get_interface_name(), future_conn_activated, timer,
+                connection.get_uuid()
+            )
+
+            # Dummy connections don't need a device nor a specific object:
+            # the dummy device is created on activation.
+            self._nm_client.activate_connection_async(
+                connection, None, None, cancellable, _on_connection_activated,
+                check_existing_interface
+            )
+
+        chain_exception(
+            self._run_on_glib_loop_thread(_activate_connection_async), future_conn_activated
+        )
+
+        return future_conn_activated
+
+    def deactivate_connection_async(self, active_connection: NM.ActiveConnection) -> Future:
+        """
+        Deactivates an active connection asynchronously, without removing
+        the connection profile.
+        https://lazka.github.io/pgi-docs/#NM-1.0/classes/Client.html#NM.Client.deactivate_connection_async
+        :param active_connection: connection to be deactivated.
+        :return: a Future to keep track of completion. Cancelling it cancels
+            the operation.
+        """
+        future_interface_removed, cancellable = self._create_operation_future()
+        timer = OperationTimer(self._metrics, "deactivate_connection")
+        timer.finish_with_future(future_interface_removed)
+
+        def _on_connection_deactivated(nm_client, res, _user_data):
+            try:
+                nm_client.deactivate_connection_finish(res)
+            except Exception as exc:  # pylint: disable=broad-except
+                set_future_exception(
+                    future_interface_removed,
+                    RuntimeError(
+                        f"Error deactivating KS connection: {nm_client=}, {res=}"
+                    ).with_traceback(exc.__traceback__)
+                )
+                return
+
+            timer.mark("deactivate_connection_finish")
+
+        def _deactivate_connection_async():
+            if future_interface_removed.done():
+                return  # The operation was cancelled before it started.
+
+            # The dummy device is removed when the connection is deactivated.
+            self._monitor_interface_removal(
+                active_connection.get_connection().get_interface_name(),
+                future_interface_removed, timer
+            )
+
+            self._nm_client.deactivate_connection_async(
+                active_connection, cancellable, _on_connection_deactivated, None
+            )
+
+        chain_exception(
+            self._run_on_glib_loop_thread(_deactivate_connection_async), future_interface_removed
+        )
+
+        return future_interface_removed
+
+    def update_connection_async(
+            self, connection: NM.RemoteConnection, new_connection: NM.Connection
+    ) -> Future:
+        """
+        Updates the IP settings of an existing connection and reapplies them
+        to the device the connection is active on, without tearing it down.
+        https://lazka.github.io/pgi-docs/#NM-1.0/classes/RemoteConnection.html#NM.RemoteConnection.update2
+        https://lazka.github.io/pgi-docs/#NM-1.0/classes/Device.html#NM.Device.reapply_async
+        :param connection: active connection to be updated.
+        :param new_connection: connection holding the new IP and user settings.
+            The rest of its settings (ID, UUID, interface name...) are ignored.
+        :return: a Future to keep track of completion. Cancelling it cancels
+            the operation.
+        """
+        future_settings_reapplied, cancellable = self._create_operation_future()
+        timer = OperationTimer(self._metrics, "update_connection")
+        timer.finish_with_future(future_settings_reapplied)
+
+        def _on_settings_reapplied(device, result, _user_data):
+            try:
+                device.reapply_finish(result)
+            except Exception as exc:  # pylint: disable=broad-except
+                set_future_exception(
+                    future_settings_reapplied,
+                    RuntimeError(
+                        f"Error reapplying KS connection settings: {device=}, {result=}"
+                    ).with_traceback(exc.__traceback__)
+                )
+                return
+
+            timer.mark("reapply_finish")
+            set_future_result(future_settings_reapplied)
+
+        def _on_connection_updated(connection, result, updated_connection):
+            try:
+                connection.update2_finish(result)
+            except Exception as exc:  # pylint: disable=broad-except
+                set_future_exception(
+                    future_settings_reapplied,
+                    RuntimeError(
+                        f"Error updating KS connection: {connection=}, {result=}"
+                    ).with_traceback(exc.__traceback__)
+                )
+                return
+
+            timer.mark("update2_finish")
+            device = self._index.get_device(connection.get_interface_name())
+            if not device:
+                set_future_exception(
+                    future_settings_reapplied,
+                    RuntimeError(
+                        f"Device {connection.get_interface_name()} not found "
+                        f"while updating KS connection."
+                    )
+                )
+                return
+
+            # A version ID of 0 skips the check that the applied connection
+            # did not change in the meantime.
+            device.reapply_async(
+                updated_connection, 0, 0, cancellable, _on_settings_reapplied, None
+            )
+
+        def _update_connection_async():
+            if future_settings_reapplied.done():
+                return  # The operation was cancelled before it started.
+
+            updated_connection = NM.SimpleConnection.new_clone(connection)
+            updated_connection.add_setting(new_connection.get_setting_ip4_config().duplicate())
+            updated_connection.add_setting(new_connection.get_setting_ip6_config().duplicate())
+            s_user = new_connection.get_setting_by_name(NM.SETTING_USER_SETTING_NAME)
+            if s_user is not None:
+                updated_connection.add_setting(s_user.duplicate())
+
+            # No flags means that the connection is kept in the same storage
+            # (in memory or on disk) it was added to.
+            connection.update2(
+                updated_connection.to_dbus(NM.ConnectionSerializationFlags.ALL),
+                NM.SettingsUpdate2Flags.NONE,
+                None,
+                cancellable,
+                _on_connection_updated,
+                updated_connection
+            )
+
+        chain_exception(
+            self._run_on_glib_loop_thread(_update_connection_async), future_settings_reapplied
+        )
+
+        return future_settings_reapplied
+
+    @property
+    def checkpoints(self) -> NMCheckpoints:
+        """Returns the object to create, roll back and destroy checkpoints with."""
+        return NMCheckpoints(
+            self._nm_client, self._run_on_glib_loop_thread,
+            self._create_operation_future, self._metrics
+        )
+
     def get_active_connection(self, conn_id: str) -> Optional[NM.ActiveConnection]:
         """
         Returns the specified active connection, if existing.
+
+        The connection is looked up in the local index kept up to date by
+        NM.Client signals, so this method does not block.
         :param conn_id: ID of the active connection.
         :return: the active connection if it was found. Otherwise, None.
         """
-        def _get_active_connection():
-            active_connections = self._nm_client.get_active_connections()
-
-            for connection in active_connections:
-                if connection.get_id() == conn_id:
-                    return connection
+        return self._index.get_active_connection(conn_id)
 
-            return None
-
-        return self._run_on_glib_loop_thread(_get_active_connection).result()
+    def get_active_connection_async(self, conn_id: str) -> Future:
+        """
+        Looks up the specified active connection asynchronously.
+        :param conn_id: ID of the active connection.
+        :return: a Future resolving to the active connection if it was found,
+            otherwise to None.
+        """
+        return self._create_resolved_future(self.get_active_connection(conn_id))
 
     def get_connection(self, conn_id: str) -> Optional[NM.RemoteConnection]:
         """
         Returns the specified connection, if existing.
+
+        The connection is looked up in the local index kept up to date by
+        NM.Client signals, so this method does not block.
         :param conn_id: ID of the connection.
         :return: the connection if it was found. Otherwise, None.
         """
+        return self._index.get_connection(conn_id)
+
+    def get_connection_async(self, conn_id: str) -> Future:
+        """
+        Looks up the specified connection asynchronously.
+        :param conn_id: ID of the connection.
+        :return: a Future resolving to the connection if it was found,
+            otherwise to None.
+        """
+        return self._create_resolved_future(self.get_connection(conn_id))
+
+    def get_connections_async(self) -> Future:
+        """
+        Lists all the connections asynchronously, including the ones sharing
+        their ID with other connections.
+        :return: a Future resolving to the list of connections.
+        """
         return self._run_on_glib_loop_thread(
-            self._nm_client.get_connection_by_id, conn_id
-        ).result()
+            lambda: list(self._nm_client.get_connections())
+        )
+
+    def get_active_connection_states(self) -> Mapping[str, Tuple[str, float]]:
+        """
+        Returns the state of the active connections and the time of their
+        last state change, by connection ID.
+
+        The states are kept up to date by NM.Client signals, so this method
+        does not block. The same mapping is returned until an active
+        connection is added, removed or changes state, so callers can cache
+        anything derived from it by identity.
+        :return: a read-only mapping of connection IDs to tuples with the
+            NM.ActiveConnectionState nick (e.g. "activated") and the
+            timestamp, in seconds since the epoch, of the last state change.
+        """
+        return self._index.get_active_connection_states()
 
     def get_nm_running(self) -> bool:
         """Returns if NetworkManager daemon is running or not."""
+        return self.get_nm_running_async().result()
+
+    def get_nm_running_async(self) -> Future:
+        """
+        Checks asynchronously if NetworkManager daemon is running or not.
+        :return: a Future resolving to True if it's running and False otherwise.
+        """
         return self._run_on_glib_loop_thread(
             self._nm_client.get_nm_running
-        ).result()
+        )
 
     def connectivity_check_get_enabled(self) -> bool:
-        """Returns if connectivity check is enabled or not."""
-        return self._run_on_glib_loop_thread(
-            self._nm_client.connectivity_check_get_enabled
-        ).result()
+        """
+        Returns if connectivity check is enabled or not.
+
+        The state is kept up to date with the notifications of the
+        connectivity-check-enabled property, so this method does not block.
+        """
+        return self._connectivity_check_enabled
 
     def disable_connectivity_check(self) -> Future:
         """Since `connectivity_check_set_enabled` has been deprecated,
@@ -301,7 +878,42 @@ class NMClient:
 
         https://developer-old.gnome.org/NetworkManager/stable/NetworkManager.conf.html
         (see under `connectivity section`)
+
+        Concurrent calls share the same request to NetworkManager, but each
+        caller gets its own future, so that cancelling it does not affect
+        the other callers.
         """
+        if not self._connectivity_check_enabled:
+            return self._create_resolved_future()
+
+        with self._connectivity_check_lock:
+            shared_future = self._disable_connectivity_check_future
+            is_new_request = shared_future is None
+            if is_new_request:
+                shared_future = self._request_connectivity_check_disabling()
+                NMClient._disable_connectivity_check_future = shared_future
+
+        if is_new_request:
+            # The callback is added once the lock is released, since it takes
+            # it and it's run right away if the request is already done
+            # (e.g. with the synchronous request used on NM < 1.24).
+            shared_future.add_done_callback(self._on_connectivity_check_disabled)
+
+        future = self._loop.create_future() if self._loop else Future()
+        chain_future(shared_future, future)
+        return future
+
+    @classmethod
+    def _on_connectivity_check_disabled(cls, future: Future):
+        with cls._connectivity_check_lock:
+            if cls._disable_connectivity_check_future is future:
+                cls._disable_connectivity_check_future = None
+
+        if not future.cancelled() and not future.exception():
+            # Not to wait for the property notification to skip the next request.
+            cls._connectivity_check_enabled = False
+
+    def _request_connectivity_check_disabling(self) -> Future:
         if Version(self._nm_client.get_version()) < Version("1.24.0"):
             # NM.Client.connectivity_check_set_enabled is deprecated since version 1.22
             # but the replacement method is only available in version 1.24.
@@ -314,39 +926,54 @@ class NMClient:
             interface_name="org.freedesktop.NetworkManager",
             property_name="ConnectivityCheckEnabled",
             value=GLib.Variant("b", False),
-            timeout_msec=-1,
-            cancellable=None
+            timeout_msec=-1
         )
 
     def _dbus_set_property(
             self, *userdata, object_path: str, interface_name: str, property_name: str,
-            value: GLib.Variant, timeout_msec: int = -1,
-            cancellable: Gio.Cancellable = None,
+            value: GLib.Variant, timeout_msec: int = -1
     ) -> Future:  # pylint: disable=too-many-arguments
         """Set NM properties since dedicated methods have been deprecated deprecated.
-        Source: https://lazka.github.io/pgi-docs/#NM-1.0/classes/Client.html"""  # noqa
+        Source: https://lazka.github.io/pgi-docs/#NM-1.0/classes/Client.html
 
-        future = _create_future()
+        Cancelling the returned future cancels the D-Bus call."""  # noqa
+
+        future, cancellable = self._create_operation_future()
 
         def _on_property_set(nm_client, res, _user_data):
-            if not nm_client or not res or not nm_client.dbus_set_property_finish(res):
-                future.set_exception(
+            try:
+                property_set = nm_client and res and nm_client.dbus_set_property_finish(res)
+            except GLib.Error as exc:
+                set_future_exception(
+                    future,
+                    RuntimeError(
+                        f"Error disabling network connectivity check: {nm_client=}, {res=}"
+                    ).with_traceback(exc.__traceback__)
+                )
+                return
+
+            if not property_set:
+                set_future_exception(
+                    future,
                     RuntimeError(
                         f"Error disabling network connectivity check: {nm_client=}, {res=}"
                     )
                 )
                 return
 
-            future.set_result(None)
+            set_future_result(future)
 
         def _set_property_async():
             self._assert_running_on_glib_loop_thread()
+            if future.done():
+                return  # The operation was cancelled before it started.
+
             self._nm_client.dbus_set_property(
                 object_path, interface_name, property_name,
                 value, timeout_msec, cancellable, _on_property_set,
                 userdata
             )
 
-        self._run_on_glib_loop_thread(_set_property_async).result()
+        chain_exception(self._run_on_glib_loop_thread(_set_property_async), future)
 
         return future
@@ -21,16 +21,18 @@ along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
 """
 from typing import Optional, TYPE_CHECKING
 
-import subprocess  # nosec B404:blacklist
-
 from proton.vpn.killswitch.interface import KillSwitch
-from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_connection_handler\
-    import KillSwitchConnectionHandler
-from proton.vpn.killswitch.backend.linux.networkmanager.util import is_ipv6_disabled
+from proton.vpn.killswitch.backend.linux.networkmanager.util import (
+    is_ipv6_disabled, is_network_manager_running, is_package_installed
+)
 from proton.vpn import logging
 
 if TYPE_CHECKING:
     from proton.vpn.connection import VPNServer
+    from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_status\
+        import KillSwitchStatus
+    from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_connection_handler\
+        import KillSwitchConnectionHandler
 
 
 logger = logging.getLogger(__name__)
@@ -49,20 +51,59 @@ class NMKillSwitch(KillSwitch):
     primary VPN connection.
     """
 
-    def __init__(self, ks_handler: KillSwitchConnectionHandler = None):
-        self._ks_handler = ks_handler or KillSwitchConnectionHandler()
+    def __init__(
+            self, ks_handler: "KillSwitchConnectionHandler" = None, transactional: bool = False
+    ):
+        """
+        :param ks_handler: kill switch connection handler.
+        :param transactional: whether `enable` should run as a transaction,
+            so that if any of its steps fails NetworkManager restores the
+            kill switch connections there were before. It only takes effect
+            when the user is allowed to create checkpoints without
+            authenticating (see `KillSwitchConnectionHandler.transaction`),
+            which is not the case for regular desktop users by default.
+        """
+        if ks_handler is None:
+            # The handler is imported lazily since it loads gi and the NM typelib,
+            # which processes only discovering kill switch backends don't need.
+            # pylint: disable=import-outside-toplevel
+            from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_connection_handler\
+                import KillSwitchConnectionHandler
+            ks_handler = KillSwitchConnectionHandler()
+
+        self._ks_handler = ks_handler
+        self._transactional = transactional
         super().__init__()
 
     async def enable(
             self, vpn_server: Optional["VPNServer"] = None, permanent: bool = False
     ):  # noqa
         """Enables general kill switch."""
+        if not self._transactional:
+            await self._enable(vpn_server, permanent)
+            return
+
+        async with self._ks_handler.transaction():
+            await self._enable(vpn_server, permanent)
+
+    async def _enable(self, vpn_server: Optional["VPNServer"], permanent: bool):
+        # If the routed KS is already enabled then it's updated in place with
+        # the new VPN server IP, which avoids tearing down its interface.
+        if vpn_server and await self._ks_handler.update_routed_killswitch_connection(
+            vpn_server.server_ip, permanent
+        ):
+            # The full KS is removed, in case it was present, to leave the
+            # system in the same state as when the routed KS is added.
+            await self._ks_handler.remove_full_killswitch_connection(
+                keep_permanent_profile=permanent
+            )
+            return
+
         # The full KS blocks all traffic except the one going to an already
         # existing VPN interface.
         await self._ks_handler.add_full_killswitch_connection(permanent)
 
-        # If the routed KS is already enabled then it needs to be removed.
-        # There is no way to just update it with the new VPN server IP.
+        # If the routed KS is still enabled at this point then it needs to be removed.
         await self._ks_handler.remove_routed_killswitch_connection()
 
         if not vpn_server:
@@ -72,13 +113,28 @@ class NMKillSwitch(KillSwitch):
         await self._ks_handler.add_routed_killswitch_connection(vpn_server.server_ip, permanent)
 
         # At this point the full KS is removed to allow establishing the new VPN connection
-        # to the specified server IP.
-        await self._ks_handler.remove_full_killswitch_connection()
+        # to the specified server IP. If the kill switch is permanent, its profile
+        # is kept since it will be needed again once the VPN connection ends.
+        await self._ks_handler.remove_full_killswitch_connection(
+            keep_permanent_profile=permanent
+        )
+
+    def status(self) -> "KillSwitchStatus":
+        """
+        Returns a snapshot of the kill switch status: whether it's enabled,
+        in which mode, and the state of each kill switch connection.
+        It does not block, so it can be polled frequently.
+        """
+        return self._ks_handler.status()
 
     async def disable(self):
         """Disables general kill switch."""
-        await self._ks_handler.remove_full_killswitch_connection()
-        await self._ks_handler.remove_routed_killswitch_connection()
+        # Both kill switch connections are independent, so they are removed concurrently
+        # and, if any of the removals fails, the error is raised once both are done.
+        await self._ks_handler.run_batch({
+            "full_killswitch": self._ks_handler.remove_full_killswitch_connection(),
+            "routed_killswitch": self._ks_handler.remove_routed_killswitch_connection(),
+        }, raise_first_error=True)
 
     async def enable_ipv6_leak_protection(self, permanent: bool = False):
         """Enables IPv6 kill switch."""
@@ -94,10 +150,10 @@ class NMKillSwitch(KillSwitch):
 
     @staticmethod
     def _validate():
-        is_libnetplan1_installed = False
-
         try:
-            KillSwitchConnectionHandler().is_network_manager_running
+            if not is_network_manager_running():
+                logger.error("NetworkManager is not running.")
+                return False
         except (ModuleNotFoundError, ImportError):
             logger.error("NetworkManager is not running.")
             return False
@@ -105,22 +161,9 @@ class NMKillSwitch(KillSwitch):
         # libnetplan0 is the first version that is present in Ubuntu 22.04. In Ubuntu 24.04
         # the package name changes to libnetplan1, and it's not compatible with this kill
         # switch implementation when IPv6 is disabled via the ipv6.disabled kernel option.
-        try:
-            subprocess.run(
-                ["/usr/bin/apt", "show", "libnetplan1"],
-                capture_output=True,
-                check=True, shell=False
-            )  # nosec B603:subprocess_without_shell_equals_true
-            is_libnetplan1_installed = True
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            # if the apt command or the libnetplan1 package are not available then it's fine.
-            pass
-
-        # if libnetplan1 is installed (most probably ubuntu 24)
-        # and IPv6 is disabled then the KS backend won't work and we log it.
         # Note: should be fixed once https://github.com/canonical/netplan/pull/495
         # is merged and pushed to Ubuntu repos.
-        if is_libnetplan1_installed and is_ipv6_disabled():
+        if is_package_installed("libnetplan1") and is_ipv6_disabled():
             logger.error(
                 "Kill switch does not work with libnetplan1 "
                 "while IPv6 is disabled via the ipv6.disabled=1 kernel parameter."
@@ -0,0 +1,172 @@
+"""
+Index of the NetworkManager objects used by the kill switch.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from threading import Lock
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+import time
+
+import gi  # pylint: disable=C0411
+gi.require_version("NM", "1.0")
+from gi.repository import NM  # noqa: E402 pylint: disable=C0413
+
+
+class NMObjectIndex:
+    """
+    Index of the connections, active connections and devices known by
+    NM.Client, by connection ID and interface name.
+
+    The index is kept up to date from the GLib loop thread using the
+    signals emitted by NM.Client, while lookups can be done from any thread.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        # connection ID -> tuple of NM.RemoteConnection, since several
+        # profiles can share the same ID (e.g. orphaned duplicates).
+        self._connections = {}
+        self._active_connections = {}  # connection ID -> NM.ActiveConnection
+        self._devices = {}  # interface name -> NM.Device
+        # connection ID -> (active connection state nick, timestamp of the last state change)
+        self._active_connection_states = {}
+        self._state_handler_ids = {}  # NM.ActiveConnection -> state-changed handler ID
+        # Read-only copy of the active connection states, discarded every
+        # time an active connection is added, removed or changes state.
+        self._states_snapshot = None
+
+    def attach(self, nm_client: NM.Client):
+        """
+        Populates the index with the objects currently known by the client and
+        subscribes to the client signals to keep it up to date.
+
+        This method must be called from the GLib loop thread.
+        """
+        for connection in nm_client.get_connections():
+            self._on_connection_added(nm_client, connection)
+        for active_connection in nm_client.get_active_connections():
+            self._on_active_connection_added(nm_client, active_connection)
+        for device in nm_client.get_devices():
+            self._on_device_added(nm_client, device)
+
+        nm_client.connect("connection-added", self._on_connection_added)
+        nm_client.connect("connection-removed", self._on_connection_removed)
+        nm_client.connect("active-connection-added", self._on_active_connection_added)
+        nm_client.connect("active-connection-removed", self._on_active_connection_removed)
+        nm_client.connect("device-added", self._on_device_added)
+        nm_client.connect("device-removed", self._on_device_removed)
+
+    def get_connection(self, conn_id: str) -> Optional[NM.RemoteConnection]:
+        """
+        Returns the connection with the specified ID, if existing. When
+        several connections share the ID, the last one added is returned.
+        """
+        connections = self._connections.get(conn_id)
+        return connections[-1] if connections else None
+
+    def get_active_connection(self, conn_id: str) -> Optional[NM.ActiveConnection]:
+        """Returns the active connection with the specified ID, if existing."""
+        return self._active_connections.get(conn_id)
+
+    def get_device(self, interface_name: str) -> Optional[NM.Device]:
+        """Returns the device with the specified interface name, if existing."""
+        return self._devices.get(interface_name)
+
+    def get_active_connection_states(self) -> Mapping[str, Tuple[str, float]]:
+        """
+        Returns the state of the active connections (e.g. "activated") and the
+        timestamp of their last state change, by connection ID.
+
+        The same read-only mapping is returned until an active connection
+        is added, removed or changes state.
+        """
+        with self._lock:
+            if self._states_snapshot is None:
+                self._states_snapshot = MappingProxyType(dict(self._active_connection_states))
+
+            return self._states_snapshot
+
+    @staticmethod
+    def _remove_value(index: dict, value):
+        for key, indexed_value in list(index.items()):
+            if indexed_value is value:
+                del index[key]
+
+    def _on_connection_added(self, _nm_client, connection):
+        with self._lock:
+            conn_id = connection.get_id()
+            # Tuples are replaced rather than updated, so that lookups
+            # done from other threads don't need the lock.
+            self._connections[conn_id] = self._connections.get(conn_id, ()) + (connection,)
+
+    def _on_connection_removed(self, _nm_client, connection):
+        with self._lock:
+            # The connection is looked up by identity in case its ID changed.
+            for conn_id, connections in list(self._connections.items()):
+                remaining_connections = tuple(
+                    indexed_connection for indexed_connection in connections
+                    if indexed_connection is not connection
+                )
+                if not remaining_connections:
+                    del self._connections[conn_id]
+                elif len(remaining_connections) != len(connections):
+                    self._connections[conn_id] = remaining_connections
+
+    def _on_active_connection_added(self, _nm_client, active_connection):
+        with self._lock:
+            conn_id = active_connection.get_id()
+            self._active_connections[conn_id] = active_connection
+            self._active_connection_states[conn_id] = (
+                active_connection.get_state().value_nick, time.time()
+            )
+            self._state_handler_ids[active_connection] = active_connection.connect(
+                "state-changed", self._on_active_connection_state_changed
+            )
+            self._states_snapshot = None
+
+    def _on_active_connection_state_changed(self, active_connection, state, _reason):
+        with self._lock:
+            conn_id = active_connection.get_id()
+            if self._active_connections.get(conn_id) is not active_connection:
+                return
+
+            self._active_connection_states[conn_id] = (
+                NM.ActiveConnectionState(state).value_nick, time.time()
+            )
+            self._states_snapshot = None
+
+    def _on_active_connection_removed(self, _nm_client, active_connection):
+        with self._lock:
+            for conn_id, indexed_active_connection in list(self._active_connections.items()):
+                if indexed_active_connection is active_connection:
+                    del self._active_connections[conn_id]
+                    del self._active_connection_states[conn_id]
+
+            handler_id = self._state_handler_ids.pop(active_connection, None)
+            if handler_id:
+                active_connection.disconnect(handler_id)
+            self._states_snapshot = None
+
+    def _on_device_added(self, _nm_client, device):
+        with self._lock:
+            self._devices[device.get_iface()] = device
+
+    def _on_device_removed(self, _nm_client, device):
+        with self._lock:
+            self._remove_value(self._devices, device)
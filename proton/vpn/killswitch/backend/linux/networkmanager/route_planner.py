@@ -0,0 +1,157 @@
+"""
+This module computes the routes used by the kill switch connections.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from dataclasses import dataclass, field
+from functools import lru_cache
+from ipaddress import (
+    collapse_addresses, ip_network, IPv4Address, IPv4Network, IPv6Address, IPv6Network
+)
+from typing import FrozenSet, Iterable, Tuple, Union
+import hashlib
+
+IPNetwork = Union[IPv4Network, IPv6Network]
+Route = Tuple[str, int]  # (network address, prefix length)
+
+# Maximum number of excluded sets for which the computed routes are kept.
+ROUTE_CACHE_SIZE = 64
+
+_MAX_PREFIX_LENGTH = {4: 32, 6: 128}
+_ADDRESS_CLASS = {4: IPv4Address, 6: IPv6Address}
+
+
+@dataclass(frozen=True)
+class NetworkSet:
+    """
+    Large, rarely changing set of networks (e.g. an allow-list of LAN subnets).
+
+    Networks are parsed, deduplicated and merged once, when the set is created
+    with `create_network_set`. Sets are hashed and compared by fingerprint only,
+    so that they can be used as cache keys regardless of their size.
+    """
+    fingerprint: str
+    networks: Tuple[IPNetwork, ...] = field(compare=False, repr=False)
+
+    def get_networks(self, version: int) -> Tuple[IPNetwork, ...]:
+        """Returns the networks of the specified IP version."""
+        return tuple(network for network in self.networks if network.version == version)
+
+
+def create_network_set(networks: Iterable[str]) -> NetworkSet:
+    """
+    Creates a network set from the specified IPs/CIDRs.
+    :raises ValueError: if any of the IPs/CIDRs is not valid.
+    """
+    parsed = [ip_network(network, strict=False) for network in networks]
+    collapsed = tuple(
+        collapsed_network
+        for version in sorted(_MAX_PREFIX_LENGTH)
+        for collapsed_network in collapse_addresses(
+            network for network in parsed if network.version == version
+        )
+    )
+    fingerprint = hashlib.sha256(
+        "\n".join(str(network) for network in collapsed).encode()
+    ).hexdigest()
+    return NetworkSet(fingerprint=fingerprint, networks=collapsed)
+
+
+EMPTY_NETWORK_SET = create_network_set(())
+
+
+def get_routes_excluding(
+        excluded_networks: Iterable[str], version: int = 4,
+        allowed_networks: NetworkSet = EMPTY_NETWORK_SET
+) -> Tuple[Route, ...]:
+    """
+    Returns the minimal set of routes covering the whole IP address space,
+    except for the specified networks.
+
+    Results are cached by excluded set and allowed network set fingerprint,
+    so asking again for the routes excluding a recently used set of networks
+    does not recompute them.
+
+    :param excluded_networks: IPs/CIDRs to be excluded. The ones not matching
+        the requested IP version are ignored.
+    :param version: IP version of the routes (4 or 6).
+    :param allowed_networks: set of networks to be excluded as well, typically
+        much larger than `excluded_networks` and shared by many calls.
+    :return: the routes, as (network address, prefix length) tuples.
+    """
+    if version not in _MAX_PREFIX_LENGTH:
+        raise ValueError(f"Invalid IP version: {version}")
+
+    excluded = frozenset(
+        network for network in (ip_network(n, strict=False) for n in excluded_networks)
+        if network.version == version
+    )
+    return _get_complement_routes(excluded, version, allowed_networks)
+
+
+@lru_cache(maxsize=ROUTE_CACHE_SIZE)
+def _get_complement_routes(
+        excluded: FrozenSet[IPNetwork], version: int, allowed_networks: NetworkSet
+) -> Tuple[Route, ...]:
+    max_prefix_length = _MAX_PREFIX_LENGTH[version]
+    address_class = _ADDRESS_CLASS[version]
+    routes = []
+    for start, end in _get_complement_intervals(
+            (*excluded, *allowed_networks.get_networks(version)), 1 << max_prefix_length
+    ):
+        routes.extend(
+            (str(address_class(network_address)), prefix_length)
+            for network_address, prefix_length in _split_interval(start, end, max_prefix_length)
+        )
+
+    return tuple(routes)
+
+
+def _get_complement_intervals(excluded: Iterable[IPNetwork], address_space_size: int):
+    """
+    Yields the [start, end) address intervals not covered by the excluded networks,
+    which are merged after being sorted by their first address.
+    """
+    next_start = 0
+    for start, end in sorted(
+        (int(network.network_address), int(network.broadcast_address) + 1)
+        for network in excluded
+    ):
+        if start > next_start:
+            yield next_start, start
+        next_start = max(next_start, end)
+
+    if next_start < address_space_size:
+        yield next_start, address_space_size
+
+
+def _split_interval(start: int, end: int, max_prefix_length: int):
+    """
+    Yields the minimal list of (network address, prefix length) CIDR blocks
+    covering the [start, end) address interval.
+    """
+    while start < end:
+        # Largest block aligned on the start address...
+        block_size = start & -start if start else 1 << max_prefix_length
+        # ... that still fits in the interval.
+        while block_size > end - start:
+            block_size >>= 1
+
+        yield start, max_prefix_length - block_size.bit_length() + 1
+        start += block_size
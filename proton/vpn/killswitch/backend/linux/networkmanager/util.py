@@ -19,11 +19,20 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
 """
+from functools import lru_cache
+from typing import FrozenSet
+import os
+
 from proton.vpn import logging
 
 
 logger = logging.getLogger(__name__)
 
+DPKG_STATUS_PATH = "/var/lib/dpkg/status"
+NM_BUS_NAME = "org.freedesktop.NetworkManager"
+# Time, in milliseconds, the D-Bus daemon is given to reply.
+DBUS_CALL_TIMEOUT_MSEC = 1000
+
 
 def is_ipv6_disabled() -> bool:
     """Returns if IPv6 is disabled at kernel level or not."""
@@ -39,3 +48,67 @@ def is_ipv6_disabled() -> bool:
         return False
 
     return False
+
+
+def is_package_installed(package_name: str, status_path: str = DPKG_STATUS_PATH) -> bool:
+    """
+    Returns if the specified package is installed according to the dpkg database.
+
+    The database is parsed directly, instead of spawning a package manager
+    process, and the result is memoized until the database file changes.
+    On distributions not using dpkg, or when the database can't be read
+    (e.g. in sandboxed installs), packages are reported as not installed.
+    """
+    try:
+        mtime = os.stat(status_path).st_mtime_ns
+        return package_name in _get_installed_packages(status_path, mtime)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        logger.warning(f"Unable to read the dpkg database at {status_path}.", exc_info=True)
+        return False
+
+
+@lru_cache(maxsize=1)
+def _get_installed_packages(status_path: str, _mtime: int) -> FrozenSet[str]:
+    """Returns the packages installed according to the dpkg status file.
+    The file modification time is only passed to invalidate the cache."""
+    installed_packages = set()
+    package_name = None
+    with open(status_path, "r", encoding="utf-8", errors="replace") as status_file:
+        for line in status_file:
+            if line.startswith("Package:"):
+                package_name = line[len("Package:"):].strip()
+            elif line.startswith("Status:") and package_name:
+                # e.g. "Status: install ok installed"
+                if line.split()[-1] == "installed":
+                    installed_packages.add(package_name)
+            elif not line.strip():
+                package_name = None  # End of the package stanza.
+
+    return frozenset(installed_packages)
+
+
+def is_network_manager_running() -> bool:
+    """
+    Returns if NetworkManager is running, by checking if its name has an owner
+    on the system bus.
+
+    This is a single synchronous D-Bus call, so that neither the NetworkManager
+    client nor the GLib loop thread it requires have to be started.
+    """
+    # gi is imported lazily so that importing this module does not require it.
+    from gi.repository import Gio, GLib  # pylint: disable=import-outside-toplevel
+
+    try:
+        bus = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+        reply = bus.call_sync(
+            "org.freedesktop.DBus", "/org/freedesktop/DBus", "org.freedesktop.DBus",
+            "NameHasOwner", GLib.Variant("(s)", (NM_BUS_NAME,)), GLib.VariantType("(b)"),
+            Gio.DBusCallFlags.NONE, DBUS_CALL_TIMEOUT_MSEC, None
+        )
+    except GLib.Error:
+        logger.exception("Unable to check if NetworkManager is running.")
+        return False
+
+    return reply.unpack()[0]
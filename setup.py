@@ -14,7 +14,10 @@ setup(
     python_requires=">=3.8",
     install_requires=["proton-vpn-api-core", "pygobject", "packaging"],
     extras_require={
-        "development": ["wheel", "pytest", "pytest-cov", "pytest-asyncio", "flake8", "pylint"]
+        "development": [
+            "wheel", "pytest", "pytest-cov", "pytest-asyncio", "flake8", "pylint",
+            "python-dbusmock"
+        ]
     },
     license="GPLv3",
     platforms="OS Independent",
@@ -0,0 +1,98 @@
+"""
+Fixtures shared by the kill switch benchmarks.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from pathlib import Path
+import os
+import shutil
+import statistics
+import subprocess
+
+import pytest
+
+from proton.vpn.killswitch.backend.linux.networkmanager.nmclient import NMClient
+
+TEMPLATE_PATH = str(Path(__file__).parent / "nm_killswitch_template.py")
+
+
+@pytest.fixture(scope="session")
+def benchmark_iterations():
+    """Number of iterations of each benchmark, set with KS_BENCHMARK_ITERATIONS."""
+    return int(os.environ.get("KS_BENCHMARK_ITERATIONS", "20"))
+
+
+@pytest.fixture(scope="session")
+def enforce_thresholds():
+    """
+    Whether the benchmarks fail when exceeding their thresholds, set with
+    KS_BENCHMARK_ENFORCE_THRESHOLDS=1. By default, the measurements are only
+    reported, since they depend on the load of the machine running them.
+    """
+    return os.environ.get("KS_BENCHMARK_ENFORCE_THRESHOLDS", "0") not in ("", "0")
+
+
+@pytest.fixture(scope="session")
+def mock_network_manager():
+    """Runs a NetworkManager stand-in (see nm_killswitch_template.py) on a private system bus.
+    The bus address is exported in DBUS_SYSTEM_BUS_ADDRESS, also for child processes."""
+    dbusmock = pytest.importorskip("dbusmock")
+    if not shutil.which("dbus-daemon"):
+        pytest.skip("dbus-daemon is required to run the benchmarks.")
+    if NMClient._nm_client:  # pylint: disable=protected-access
+        pytest.skip("NMClient is already connected to another NetworkManager instance.")
+
+    dbusmock.DBusTestCase.start_system_bus()
+    process, _ = dbusmock.DBusTestCase.spawn_server_template(
+        TEMPLATE_PATH, {"Version": "1.46.0"}, stdout=subprocess.DEVNULL
+    )
+    yield
+    NMClient.shutdown()
+    process.terminate()
+    process.wait()
+    dbusmock.DBusTestCase.tearDownClass()
+
+
+def _percentiles(samples):
+    if len(samples) < 2:
+        return samples[0], samples[0], samples[0]
+
+    percentiles = statistics.quantiles(samples, n=100, method="inclusive")
+    return percentiles[49], percentiles[89], percentiles[98]
+
+
+@pytest.fixture
+def report_latencies(capsys):
+    """
+    Returns a function printing the p50/p90/p99 latencies of each benchmark
+    step, even when pytest captures the output.
+    The function returns the (p50, p90, p99) latencies, in seconds, by step.
+    """
+    def _report(title, latencies):
+        percentiles = {step: _percentiles(samples) for step, samples in latencies.items()}
+        with capsys.disabled():
+            print(f"\n{title} (ms):")
+            print(f"{'step':<40}{'p50':>10}{'p90':>10}{'p99':>10}")
+            for step, step_percentiles in percentiles.items():
+                p50, p90, p99 = (value * 1000 for value in step_percentiles)
+                print(f"{step:<40}{p50:>10.2f}{p90:>10.2f}{p99:>10.2f}")
+
+        return percentiles
+
+    return _report
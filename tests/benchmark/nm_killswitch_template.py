@@ -0,0 +1,166 @@
+"""
+python-dbusmock template standing in for NetworkManager in the kill switch benchmarks.
+
+It extends the NetworkManager template shipped with python-dbusmock so that,
+like the real daemon does with dummy connections, adding a connection creates
+its device (device-added), activates it after a short delay (state-changed) and
+deleting the connection removes the device again (device-removed).
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import itertools
+
+import dbus
+import dbusmock
+from dbusmock.templates import networkmanager
+# D-Bus methods are imported so that python-dbusmock also adds them to the mock.
+from dbusmock.templates.networkmanager import (  # noqa: F401 pylint: disable=unused-import
+    BUS_NAME, MAIN_OBJ, SYSTEM_BUS, IS_OBJECT_MANAGER,
+    MANAGER_OBJ, MANAGER_IFACE, SETTINGS_OBJ, SETTINGS_IFACE, DEVICE_IFACE,
+    CSETTINGS_IFACE, ACTIVE_CONNECTION_IFACE, DeviceState, NMActiveConnectionState,
+    SetProperty, SetGlobalConnectionState, SetDeviceActive, SetDeviceDisconnected,
+    AddActiveConnection, RemoveActiveConnection,
+    SettingsAddConnection, SettingsGetConnectionByUuid
+)
+from gi.repository import GLib
+
+DUMMY_DEVICE_IFACE = "org.freedesktop.NetworkManager.Device.Dummy"
+NM_DEVICE_TYPE_DUMMY = 22
+
+# Time it takes to the mock to create a device and to activate it.
+DEVICE_DELAY_MS = 5
+
+_ids = itertools.count()
+
+
+def load(mock, parameters):
+    """Loads the NetworkManager template and overrides the methods
+    handling connections to mimic what NetworkManager does with dummy connections."""
+    networkmanager.load(mock, parameters)
+
+    manager = dbusmock.get_object(MANAGER_OBJ)
+    manager.AddProperties(MANAGER_IFACE, {
+        "ConnectivityCheckEnabled": parameters.get("ConnectivityCheckEnabled", True),
+        "ConnectivityCheckAvailable": True,
+    })
+
+    settings = dbusmock.get_object(SETTINGS_OBJ)
+    settings.AddMethods(SETTINGS_IFACE, [
+        ("AddConnection", "a{sa{sv}}", "o", _add_connection),
+        ("AddConnectionUnsaved", "a{sa{sv}}", "o", _add_connection),
+    ])
+
+
+def _add_connection(settings, connection_settings):
+    connection_path = settings.SettingsAddConnection(connection_settings)
+
+    connection = dbusmock.get_object(connection_path)
+    connection.AddMethods(CSETTINGS_IFACE, [
+        ("Delete", "", "", _delete_connection),
+        ("Update2", "a{sa{sv}}ua{sv}", "a{sv}", _update_connection),
+    ])
+
+    interface_name = str(connection_settings["connection"]["interface-name"])
+    GLib.timeout_add(DEVICE_DELAY_MS, _add_device, connection_path, interface_name)
+
+    return connection_path
+
+
+def _update_connection(connection, connection_settings, _flags, _args):
+    networkmanager.ConnectionUpdate(connection, connection_settings)
+    return dbus.Dictionary({}, signature="sv")
+
+
+def _add_device(connection_path, interface_name):
+    manager = dbusmock.get_object(MANAGER_OBJ)
+
+    device_path = f"/org/freedesktop/NetworkManager/Devices/{next(_ids)}"
+    manager.AddObject(device_path, DUMMY_DEVICE_IFACE, {"HwAddress": "00:00:00:00:00:00"}, [])
+    device = dbusmock.get_object(device_path)
+    device.AddProperties(DEVICE_IFACE, {
+        "DeviceType": dbus.UInt32(NM_DEVICE_TYPE_DUMMY),
+        "State": dbus.UInt32(DeviceState.PREPARE),
+        "StateReason": (dbus.UInt32(DeviceState.PREPARE), dbus.UInt32(0)),
+        "Interface": interface_name,
+        "IpInterface": interface_name,
+        "ActiveConnection": dbus.ObjectPath("/"),
+        "AvailableConnections": dbus.Array([dbus.ObjectPath(connection_path)], signature="o"),
+        "AutoConnect": False,
+        "Managed": True,
+        "Driver": "dummy",
+    })
+    device.AddMethods(DEVICE_IFACE, [
+        ("Reapply", "a{sa{sv}}tu", "", ""),
+        ("Disconnect", "", "", ""),
+    ])
+    manager.object_manager_emit_added(device_path)
+
+    devices = manager.Get(MANAGER_IFACE, "Devices")
+    devices.append(dbus.ObjectPath(device_path))
+    manager.Set(MANAGER_IFACE, "Devices", devices)
+    manager.EmitSignal(MANAGER_IFACE, "DeviceAdded", "o", [dbus.ObjectPath(device_path)])
+
+    GLib.timeout_add(DEVICE_DELAY_MS, _activate_device, device_path, connection_path)
+    return GLib.SOURCE_REMOVE
+
+
+def _activate_device(device_path, connection_path):
+    manager = dbusmock.get_object(MANAGER_OBJ)
+    manager.AddActiveConnection(
+        [device_path], connection_path, "/", str(next(_ids)),
+        dbus.UInt32(NMActiveConnectionState.NM_ACTIVE_CONNECTION_STATE_ACTIVATED)
+    )
+    return GLib.SOURCE_REMOVE
+
+
+def _delete_connection(connection):
+    manager = dbusmock.get_object(MANAGER_OBJ)
+    settings = dbusmock.get_object(SETTINGS_OBJ)
+    connection_path = connection.__dbus_object_path__
+
+    for active_connection_path in list(manager.Get(MANAGER_IFACE, "ActiveConnections")):
+        active_connection = dbusmock.get_object(active_connection_path)
+        if active_connection.Get(ACTIVE_CONNECTION_IFACE, "Connection") != connection_path:
+            continue
+
+        for device_path in active_connection.Get(ACTIVE_CONNECTION_IFACE, "Devices"):
+            manager.RemoveActiveConnection(device_path, active_connection_path)
+            GLib.timeout_add(DEVICE_DELAY_MS, _remove_device, str(device_path))
+
+    connections = settings.ListConnections()
+    connections.remove(connection_path)
+    settings.Set(SETTINGS_IFACE, "Connections", connections)
+    settings.EmitSignal(SETTINGS_IFACE, "ConnectionRemoved", "o", [connection_path])
+    connection.EmitSignal(CSETTINGS_IFACE, "Removed", "", [])
+
+    manager.object_manager_emit_removed(connection_path)
+    manager.RemoveObject(connection_path)
+
+
+def _remove_device(device_path):
+    manager = dbusmock.get_object(MANAGER_OBJ)
+
+    devices = manager.Get(MANAGER_IFACE, "Devices")
+    devices.remove(dbus.ObjectPath(device_path))
+    manager.Set(MANAGER_IFACE, "Devices", devices)
+    manager.EmitSignal(MANAGER_IFACE, "DeviceRemoved", "o", [dbus.ObjectPath(device_path)])
+
+    manager.object_manager_emit_removed(device_path)
+    manager.RemoveObject(device_path)
+    return GLib.SOURCE_REMOVE
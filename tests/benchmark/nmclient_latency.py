@@ -0,0 +1,75 @@
+"""
+Measures the latency of NetworkManager operations run with one of the
+NMClient engines, printing the samples as JSON. It runs in its own process
+since the engine is chosen when the NMClient singleton is started.
+
+Usage: python nmclient_latency.py <thread|asyncio> <iterations>
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from collections import defaultdict
+import asyncio
+import json
+import sys
+import time
+
+from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_connection_handler import (
+    KillSwitchConnectionHandler
+)
+from proton.vpn.killswitch.backend.linux.networkmanager.nmclient import NMClient
+
+
+async def _measure_latencies(iterations: int) -> dict:
+    nm_client = NMClient()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="latency")
+    latencies = defaultdict(list)
+
+    async def _measure(step, awaitable):
+        start = time.perf_counter()
+        await awaitable
+        latencies[step].append(time.perf_counter() - start)
+
+    for _ in range(iterations):
+        await _measure("get_nm_running", asyncio.wrap_future(nm_client.get_nm_running_async()))
+        await _measure("add_ipv6_leak_protection", handler.add_ipv6_leak_protection())
+        await _measure("remove_ipv6_leak_protection", handler.remove_ipv6_leak_protection())
+
+    return latencies
+
+
+async def _measure_latencies_on_asyncio_engine(iterations: int) -> dict:
+    NMClient.start_on_asyncio_loop()
+    return await _measure_latencies(iterations)
+
+
+def main(engine: str, iterations: int):
+    """Prints the latencies measured with the specified engine."""
+    if engine == "asyncio":
+        from gi.events import GLibEventLoopPolicy  # pylint: disable=import-outside-toplevel
+        asyncio.set_event_loop_policy(GLibEventLoopPolicy())
+        latencies = asyncio.run(_measure_latencies_on_asyncio_engine(iterations))
+    else:
+        latencies = asyncio.run(_measure_latencies(iterations))
+
+    NMClient.shutdown()
+    print(json.dumps(latencies))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], int(sys.argv[2]))
@@ -0,0 +1,58 @@
+"""
+Import-time benchmark of the kill switch backend.
+
+Backend discovery only needs NMKillSwitch class methods, so importing the
+package must be cheap and must not load gi nor the NM typelib.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import json
+import subprocess
+import sys
+
+# Generous upper bound for the import time, in seconds, to catch heavy
+# dependencies being imported eagerly again. It's only enforced with
+# KS_BENCHMARK_ENFORCE_THRESHOLDS=1, while not loading gi is always checked.
+MAX_IMPORT_TIME = 0.5
+
+DISCOVERY_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from proton.vpn.killswitch.backend.linux.networkmanager import NMKillSwitch
+NMKillSwitch._get_priority()
+print(json.dumps({
+    "import_time": time.perf_counter() - start,
+    "modules": [name for name in ("gi", "gi.repository.NM") if name in sys.modules],
+}))
+"""
+
+
+def test_backend_discovery_does_not_load_gi(capsys, enforce_thresholds):
+    # A new interpreter is used so that modules imported by other tests don't count.
+    process = subprocess.run(
+        [sys.executable, "-c", DISCOVERY_SCRIPT], capture_output=True, check=True, text=True
+    )  # nosec B603:subprocess_without_shell_equals_true
+    result = json.loads(process.stdout)
+
+    with capsys.disabled():
+        print(f"\nKill switch backend import time: {result['import_time'] * 1000:.2f} ms")
+
+    assert result["modules"] == []
+    if enforce_thresholds:
+        assert result["import_time"] < MAX_IMPORT_TIME
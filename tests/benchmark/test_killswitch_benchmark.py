@@ -0,0 +1,85 @@
+"""
+End-to-end kill switch benchmarks.
+
+NMKillSwitch is driven through enable/disable cycles against a NetworkManager
+stand-in (see nm_killswitch_template.py) running on a private system bus, so
+that latency regressions show up in a normal test run.
+
+The number of cycles can be set with the KS_BENCHMARK_ITERATIONS env variable.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from collections import defaultdict
+from types import SimpleNamespace
+import time
+
+import pytest
+
+from proton.vpn.killswitch.backend.linux.networkmanager import NMKillSwitch
+from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_connection_handler import (
+    KillSwitchConnectionHandler
+)
+from proton.vpn.killswitch.backend.linux.networkmanager.metrics import InMemoryMetricsCollector
+
+# Generous upper bound for the p99 latency of any step, in seconds. It's only
+# meant to catch severe regressions (e.g. operations waiting for timeouts),
+# and it's only enforced with KS_BENCHMARK_ENFORCE_THRESHOLDS=1.
+MAX_P99_LATENCY = 1.0
+
+SERVERS = [SimpleNamespace(server_ip=ip) for ip in ("185.159.157.1", "185.159.158.1")]
+
+
+async def _measure(latencies, step, coroutine):
+    start = time.perf_counter()
+    await coroutine
+    latencies[step].append(time.perf_counter() - start)
+
+
+@pytest.mark.asyncio
+async def test_killswitch_latency(
+        mock_network_manager, benchmark_iterations, report_latencies, enforce_thresholds
+):  # pylint: disable=unused-argument
+    metrics = InMemoryMetricsCollector()
+    handler = KillSwitchConnectionHandler(connection_prefix="benchmark", metrics=metrics)
+    killswitch = NMKillSwitch(handler)
+    latencies = defaultdict(list)
+
+    for _ in range(benchmark_iterations):
+        await _measure(latencies, "enable", killswitch.enable())
+        await _measure(latencies, "enable_with_server", killswitch.enable(SERVERS[0]))
+        await _measure(latencies, "switch_server", killswitch.enable(SERVERS[1]))
+        await _measure(
+            latencies, "enable_ipv6_leak_protection", killswitch.enable_ipv6_leak_protection()
+        )
+        await _measure(
+            latencies, "disable_ipv6_leak_protection", killswitch.disable_ipv6_leak_protection()
+        )
+        await _measure(latencies, "disable", killswitch.disable())
+
+    percentiles = report_latencies(
+        f"Kill switch latency over {benchmark_iterations} iterations", latencies
+    )
+
+    outcomes = metrics.dump()["outcomes"]
+    assert all(set(counts) == {"success"} for counts in outcomes.values()), outcomes
+    if not enforce_thresholds:
+        return
+
+    for step, (_, _, p99) in percentiles.items():
+        assert p99 < MAX_P99_LATENCY, step
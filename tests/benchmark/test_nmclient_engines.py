@@ -0,0 +1,63 @@
+"""
+Latency comparison between the threaded and the asyncio NMClient engines.
+
+
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from importlib.util import find_spec
+from pathlib import Path
+import json
+import subprocess
+import sys
+
+import pytest
+
+SCRIPT_PATH = str(Path(__file__).parent / "nmclient_latency.py")
+
+
+def _has_glib_asyncio_integration() -> bool:
+    try:
+        return find_spec("gi.events") is not None
+    except ImportError:
+        return False
+
+
+@pytest.mark.parametrize("engine", [
+    "thread",
+    pytest.param("asyncio", marks=pytest.mark.skipif(
+        not _has_glib_asyncio_integration(),
+        reason="GLib asyncio integration requires PyGObject 3.50 or newer."
+    )),
+])
+def test_nmclient_engine_latency(
+        engine, mock_network_manager, benchmark_iterations, report_latencies
+):  # pylint: disable=unused-argument
+    # Each engine is measured in a new process, where the NMClient singleton
+    # is started with it, connecting to the mocked NetworkManager.
+    process = subprocess.run(
+        [sys.executable, SCRIPT_PATH, engine, str(benchmark_iterations)],
+        capture_output=True, check=True, text=True, timeout=300
+    )  # nosec B603:subprocess_without_shell_equals_true
+    latencies = json.loads(process.stdout.splitlines()[-1])
+
+    percentiles = report_latencies(
+        f"NMClient {engine} engine latency over {benchmark_iterations} iterations", latencies
+    )
+    assert set(percentiles) == {
+        "get_nm_running", "add_ipv6_leak_protection", "remove_ipv6_leak_protection"
+    }
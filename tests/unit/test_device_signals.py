@@ -0,0 +1,100 @@
+"""
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from unittest.mock import Mock, call
+
+from proton.vpn.killswitch.backend.linux.networkmanager.device_signals import (
+    DeviceSignalDispatcher
+)
+
+DEVICE_ADDED = DeviceSignalDispatcher.DEVICE_ADDED
+DEVICE_REMOVED = DeviceSignalDispatcher.DEVICE_REMOVED
+
+
+def _device(interface_name):
+    device = Mock()
+    device.get_iface.return_value = interface_name
+    return device
+
+
+def test_attach_connects_a_single_handler_per_signal():
+    nm_client = Mock()
+    dispatcher = DeviceSignalDispatcher()
+
+    dispatcher.attach(nm_client)
+
+    assert nm_client.connect.call_args_list == [
+        call(DEVICE_ADDED, dispatcher._dispatch, DEVICE_ADDED),
+        call(DEVICE_REMOVED, dispatcher._dispatch, DEVICE_REMOVED),
+    ]
+
+
+def test_dispatch_only_calls_waiters_for_the_signal_and_interface():
+    dispatcher = DeviceSignalDispatcher()
+    ks_added, other_added, ks_removed = Mock(), Mock(), Mock()
+    dispatcher.add_waiter(DEVICE_ADDED, "pvpnksintrf0", ks_added)
+    dispatcher.add_waiter(DEVICE_ADDED, "pvpnrouteintrf0", other_added)
+    dispatcher.add_waiter(DEVICE_REMOVED, "pvpnksintrf0", ks_removed)
+    device = _device("pvpnksintrf0")
+
+    dispatcher._dispatch(Mock(), device, DEVICE_ADDED)
+    dispatcher._dispatch(Mock(), _device("eth0"), DEVICE_ADDED)
+
+    ks_added.assert_called_once_with(device)
+    other_added.assert_not_called()
+    ks_removed.assert_not_called()
+
+
+def test_removed_waiters_are_not_called_anymore():
+    dispatcher = DeviceSignalDispatcher()
+    callback = Mock()
+    dispatcher.add_waiter(DEVICE_ADDED, "pvpnksintrf0", callback)
+
+    dispatcher.remove_waiter(DEVICE_ADDED, "pvpnksintrf0", callback)
+    dispatcher._dispatch(Mock(), _device("pvpnksintrf0"), DEVICE_ADDED)
+
+    callback.assert_not_called()
+    assert not dispatcher._waiters[DEVICE_ADDED]
+
+
+def test_removing_unknown_waiter_does_nothing():
+    dispatcher = DeviceSignalDispatcher()
+    callback = Mock()
+    dispatcher.add_waiter(DEVICE_ADDED, "pvpnksintrf0", callback)
+
+    dispatcher.remove_waiter(DEVICE_ADDED, "pvpnksintrf0", Mock())
+    dispatcher.remove_waiter(DEVICE_REMOVED, "pvpnksintrf0", callback)
+
+    assert dispatcher._waiters[DEVICE_ADDED]["pvpnksintrf0"] == [callback]
+
+
+def test_waiters_can_remove_themselves_while_being_dispatched():
+    dispatcher = DeviceSignalDispatcher()
+    second_callback = Mock()
+
+    def _first_callback(_device):
+        dispatcher.remove_waiter(DEVICE_ADDED, "pvpnksintrf0", _first_callback)
+
+    dispatcher.add_waiter(DEVICE_ADDED, "pvpnksintrf0", _first_callback)
+    dispatcher.add_waiter(DEVICE_ADDED, "pvpnksintrf0", second_callback)
+    device = _device("pvpnksintrf0")
+
+    dispatcher._dispatch(Mock(), device, DEVICE_ADDED)
+
+    second_callback.assert_called_once_with(device)
+    assert dispatcher._waiters[DEVICE_ADDED]["pvpnksintrf0"] == [second_callback]
@@ -0,0 +1,89 @@
+"""
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_connection import (
+    KillSwitchConnection, KillSwitchGeneralConfig, KillSwitchIPConfig,
+    get_connection_fingerprint
+)
+
+
+def _create_kill_switch_connection(connection_id, routes):
+    return KillSwitchConnection(
+        KillSwitchGeneralConfig(human_readable_id=connection_id, interface_name="testintrf0"),
+        ipv4_settings=KillSwitchIPConfig(
+            addresses=["100.85.0.1/24"],
+            dns=["0.0.0.0"],  # nosec hardcoded_bind_all_interfaces
+            dns_priority=-1400,
+            ignore_auto_dns=True,
+            route_metric=98,
+            routes=routes
+        ),
+        ipv6_settings=None
+    )
+
+
+def _get_routes(connection):
+    s_ip4 = connection.get_setting_ip4_config()
+    return [
+        (s_ip4.get_route(i).get_dest(), s_ip4.get_route(i).get_prefix())
+        for i in range(s_ip4.get_num_routes())
+    ]
+
+
+def test_connections_with_the_same_shape_only_differ_in_id_uuid_and_routes():
+    first = _create_kill_switch_connection("test-1", routes=[("0.0.0.0", 1)]).connection
+    second = _create_kill_switch_connection("test-2", routes=[("128.0.0.0", 1)]).connection
+
+    assert first is not second
+    assert (first.get_id(), second.get_id()) == ("test-1", "test-2")
+    assert first.get_uuid() != second.get_uuid()
+    assert _get_routes(first) == [("0.0.0.0", 1)]
+    assert _get_routes(second) == [("128.0.0.0", 1)]
+    assert first.get_interface_name() == second.get_interface_name() == "testintrf0"
+    assert first.get_setting_ip4_config().get_route_metric() == 98
+
+
+def test_ipv6_routes_are_added_to_the_ipv6_settings():
+    connection = KillSwitchConnection(
+        KillSwitchGeneralConfig(human_readable_id="test-ipv6", interface_name="testintrf1"),
+        ipv4_settings=None,
+        ipv6_settings=KillSwitchIPConfig(
+            addresses=["fdeb:446c:912d:08da::/64"],
+            dns=["::1"],
+            dns_priority=-1400,
+            ignore_auto_dns=True,
+            route_metric=95,
+            routes=[("::", 1), ("8000::", 1)]
+        )
+    ).connection
+
+    s_ip6 = connection.get_setting_ip6_config()
+    assert [
+        (s_ip6.get_route(i).get_dest(), s_ip6.get_route(i).get_prefix())
+        for i in range(s_ip6.get_num_routes())
+    ] == [("::", 1), ("8000::", 1)]
+
+
+def test_fingerprint_is_stored_in_the_connection_profile_and_depends_on_the_settings():
+    first = _create_kill_switch_connection("test-1", routes=[("0.0.0.0", 1)])
+    same = _create_kill_switch_connection("test-1", routes=[("0.0.0.0", 1)])
+    other = _create_kill_switch_connection("test-1", routes=[("128.0.0.0", 1)])
+
+    assert get_connection_fingerprint(first.connection) == first.fingerprint == same.fingerprint
+    assert other.fingerprint != first.fingerprint
+    assert get_connection_fingerprint(other.connection) == other.fingerprint
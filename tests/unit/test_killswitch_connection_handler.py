@@ -0,0 +1,643 @@
+"""
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+from concurrent.futures import Future
+from ipaddress import ip_network
+from unittest.mock import Mock, patch
+
+import pytest
+
+from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_connection_handler import (
+    KillSwitchConnectionHandler
+)
+
+HANDLER_MODULE = "proton.vpn.killswitch.backend.linux.networkmanager.killswitch_connection_handler"
+
+
+def _resolved_future(result=None):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _failed_future(exc):
+    future = Future()
+    future.set_exception(exc)
+    return future
+
+
+@pytest.fixture
+def nm_client():
+    nm_client_mock = Mock()
+    nm_client_mock.connectivity_check_get_enabled.return_value = False
+    nm_client_mock.get_active_connection_async.return_value = _resolved_future(None)
+    nm_client_mock.get_connection_async.return_value = _resolved_future(None)
+    return nm_client_mock
+
+
+@pytest.mark.asyncio
+async def test_add_full_killswitch_connection_uses_non_blocking_lookups(nm_client):
+    nm_client.get_active_connection_async.return_value = _resolved_future(Mock())
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    await handler.add_full_killswitch_connection(permanent=False)
+
+    nm_client.get_active_connection_async.assert_called_once_with(conn_id="test-killswitch")
+    nm_client.get_active_connection.assert_not_called()
+    nm_client.disable_connectivity_check.assert_not_called()
+    nm_client.add_connection_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_remove_ipv6_leak_protection_does_nothing_when_connection_is_not_found(nm_client):
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    await handler.remove_ipv6_leak_protection()
+
+    nm_client.get_connection_async.assert_called_once_with(conn_id="test-killswitch-ipv6")
+    nm_client.get_connection.assert_not_called()
+    nm_client.remove_connection_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_add_routed_killswitch_connection_allows_all_server_ips_through(
+        kill_switch_connection_class, nm_client
+):
+    nm_client.add_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+    server_ips = ["1.1.1.1", "2.2.2.0/24"]
+
+    await handler.add_routed_killswitch_connection(server_ips, permanent=False)
+
+    kill_switch_connection_class.assert_called_once()
+    ipv4_settings = kill_switch_connection_class.call_args.kwargs["ipv4_settings"]
+    routes = [ip_network(f"{address}/{prefix}") for address, prefix in ipv4_settings.routes]
+    assert not any(
+        route.overlaps(ip_network(server_ip)) for route in routes for server_ip in server_ips
+    )
+    assert sum(route.num_addresses for route in routes) == 2 ** 32 - 1 - 256
+    nm_client.add_connection_async.assert_called_once_with(
+        kill_switch_connection_class.return_value.connection, save_to_disk=False
+    )
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_add_routed_killswitch_connection_with_routing_rules(
+        kill_switch_connection_class, nm_client
+):
+    nm_client.add_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(
+        nm_client, connection_prefix="test", use_routing_rules=True
+    )
+
+    await handler.add_routed_killswitch_connection(["1.1.1.1", "2.2.2.0/24"], permanent=False)
+
+    ipv4_settings = kill_switch_connection_class.call_args.kwargs["ipv4_settings"]
+    assert ipv4_settings.routes == []
+    assert ipv4_settings.gateway
+    assert ipv4_settings.route_table
+    assert ipv4_settings.routing_rules[:2] == [
+        "priority 28585 to 1.1.1.1/32 table 254",
+        "priority 28585 to 2.2.2.0/24 table 254",
+    ]
+    assert ipv4_settings.routing_rules[-1] == f"priority 28587 table {ipv4_settings.route_table}"
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_add_routed_killswitch_connection_allows_ipv6_server_ips_through(
+        kill_switch_connection_class, nm_client
+):
+    nm_client.add_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+    server_ip = "2a07:b944::2:1"
+
+    await handler.add_routed_killswitch_connection(server_ip, permanent=False)
+
+    ipv4_settings = kill_switch_connection_class.call_args.kwargs["ipv4_settings"]
+    assert ipv4_settings.routes == []
+    assert ipv4_settings.gateway
+    ipv6_settings = kill_switch_connection_class.call_args.kwargs["ipv6_settings"]
+    routes = [ip_network(f"{address}/{prefix}") for address, prefix in ipv6_settings.routes]
+    assert len(routes) == 128
+    assert not any(route.overlaps(ip_network(server_ip)) for route in routes)
+    assert ipv6_settings.gateway is None
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_add_full_killswitch_connection_keeps_default_gateway_with_allowed_networks(
+        kill_switch_connection_class, nm_client
+):
+    nm_client.add_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(
+        nm_client, connection_prefix="test", allowed_networks=["192.168.1.0/24", "fd00::/8"]
+    )
+
+    await handler.add_full_killswitch_connection(permanent=False)
+    await handler.add_ipv6_leak_protection()
+
+    full_ks_kwargs, ipv6_ks_kwargs = (
+        call.kwargs for call in kill_switch_connection_class.call_args_list
+    )
+    for ip_settings in (
+            full_ks_kwargs["ipv4_settings"], full_ks_kwargs["ipv6_settings"],
+            ipv6_ks_kwargs["ipv6_settings"]
+    ):
+        # More specific routes would take precedence over the VPN default route.
+        assert ip_settings.gateway
+        assert ip_settings.routes == []
+        assert ip_settings.routing_rules == []
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_add_routed_killswitch_connection_allows_allowed_networks_through(
+        kill_switch_connection_class, nm_client
+):
+    nm_client.add_connection_async.return_value = _resolved_future()
+    allowed_networks = ["192.168.1.0/24", "10.0.0.0/8"]
+    handler = KillSwitchConnectionHandler(
+        nm_client, connection_prefix="test", allowed_networks=allowed_networks
+    )
+
+    await handler.add_routed_killswitch_connection("1.1.1.1", permanent=False)
+
+    ipv4_settings = kill_switch_connection_class.call_args.kwargs["ipv4_settings"]
+    routes = [ip_network(f"{address}/{prefix}") for address, prefix in ipv4_settings.routes]
+    assert ipv4_settings.gateway is None
+    assert not any(
+        route.overlaps(ip_network(network))
+        for route in routes for network in allowed_networks + ["1.1.1.1"]
+    )
+    assert sum(route.num_addresses for route in routes) == 2 ** 32 - 2 ** 24 - 2 ** 8 - 1
+
+
+@pytest.mark.asyncio
+async def test_add_routed_killswitch_connection_raises_error_without_server_ips(nm_client):
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    with pytest.raises(ValueError):
+        await handler.add_routed_killswitch_connection([], permanent=False)
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}._has_same_settings", return_value=True)
+async def test_add_permanent_full_killswitch_connection_reactivates_saved_connection(
+        _has_same_settings, nm_client
+):
+    saved_connection = Mock()
+    nm_client.get_connection_async.side_effect = lambda conn_id: _resolved_future(
+        saved_connection if conn_id == "test-killswitch-perm" else None
+    )
+    nm_client.activate_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(
+        nm_client, connection_prefix="test", reuse_permanent_connection=True
+    )
+
+    await handler.add_full_killswitch_connection(permanent=True)
+
+    nm_client.activate_connection_async.assert_called_once_with(saved_connection)
+    nm_client.add_connection_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}._has_same_settings", return_value=False)
+async def test_add_permanent_full_killswitch_connection_replaces_outdated_saved_connection(
+        _has_same_settings, nm_client
+):
+    saved_connection = Mock()
+    nm_client.get_connection_async.side_effect = lambda conn_id: _resolved_future(
+        saved_connection if conn_id == "test-killswitch-perm" else None
+    )
+    nm_client.remove_connection_async.return_value = _resolved_future()
+    nm_client.add_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(
+        nm_client, connection_prefix="test", reuse_permanent_connection=True
+    )
+
+    await handler.add_full_killswitch_connection(permanent=True)
+
+    nm_client.remove_connection_async.assert_called_once_with(saved_connection)
+    nm_client.activate_connection_async.assert_not_called()
+    nm_client.add_connection_async.assert_called_once()
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.get_connection_fingerprint")
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_add_routed_killswitch_connection_is_skipped_when_settings_did_not_change(
+        kill_switch_connection_class, get_connection_fingerprint, nm_client
+):
+    get_connection_fingerprint.return_value = kill_switch_connection_class.return_value.fingerprint
+    nm_client.get_active_connection_async.return_value = _resolved_future(Mock())
+    nm_client.get_connection_async.return_value = _resolved_future(Mock())
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    await handler.add_routed_killswitch_connection("1.1.1.1", permanent=False)
+
+    nm_client.add_connection_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.get_connection_fingerprint", return_value="outdated")
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_add_routed_killswitch_connection_updates_active_connection_with_other_settings(
+        kill_switch_connection_class, _get_connection_fingerprint, nm_client
+):
+    connection = Mock()
+    nm_client.get_active_connection_async.return_value = _resolved_future(Mock())
+    nm_client.get_connection_async.return_value = _resolved_future(connection)
+    nm_client.update_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    await handler.add_routed_killswitch_connection("1.1.1.1", permanent=False)
+
+    nm_client.update_connection_async.assert_called_once_with(
+        connection, kill_switch_connection_class.return_value.connection
+    )
+    nm_client.add_connection_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.get_connection_fingerprint", return_value="outdated")
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_add_routed_killswitch_connection_replaces_active_connection_failing_to_update(
+        kill_switch_connection_class, _get_connection_fingerprint, nm_client
+):
+    connection = Mock()
+    nm_client.get_active_connection_async.return_value = _resolved_future(Mock())
+    nm_client.get_connection_async.return_value = _resolved_future(connection)
+    nm_client.update_connection_async.return_value = _failed_future(RuntimeError("Expected"))
+    nm_client.remove_connection_async.return_value = _resolved_future()
+    nm_client.add_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    await handler.add_routed_killswitch_connection("1.1.1.1", permanent=False)
+
+    nm_client.remove_connection_async.assert_called_once_with(connection)
+    nm_client.add_connection_async.assert_called_once_with(
+        kill_switch_connection_class.return_value.connection, save_to_disk=False
+    )
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.get_connection_fingerprint")
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_update_routed_killswitch_connection_is_skipped_when_settings_did_not_change(
+        kill_switch_connection_class, get_connection_fingerprint, nm_client
+):
+    get_connection_fingerprint.return_value = kill_switch_connection_class.return_value.fingerprint
+    nm_client.get_active_connection_async.return_value = _resolved_future(Mock())
+    nm_client.get_connection_async.return_value = _resolved_future(Mock())
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    assert await handler.update_routed_killswitch_connection("1.1.1.1", permanent=False)
+
+    nm_client.update_connection_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_update_routed_killswitch_connection_returns_false_without_active_connection(
+        nm_client
+):
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    assert not await handler.update_routed_killswitch_connection("1.1.1.1", permanent=False)
+
+    nm_client.get_active_connection_async.assert_called_once_with(conn_id="test-routed-killswitch")
+    nm_client.update_connection_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.get_connection_fingerprint", return_value="outdated")
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_update_routed_killswitch_connection_passes_new_profile_to_update(
+        kill_switch_connection_class, _get_connection_fingerprint, nm_client
+):
+    connection = Mock()
+    nm_client.get_active_connection_async.return_value = _resolved_future(Mock())
+    nm_client.get_connection_async.return_value = _resolved_future(connection)
+    nm_client.update_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    assert await handler.update_routed_killswitch_connection("1.1.1.1", permanent=False)
+
+    nm_client.update_connection_async.assert_called_once_with(
+        connection, kill_switch_connection_class.return_value.connection
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("update_future_factory", [
+    lambda: _failed_future(RuntimeError("Error updating KS connection")),
+    Future,  # Never resolved, so the update times out.
+])
+@patch(f"{HANDLER_MODULE}.get_connection_fingerprint", return_value="outdated")
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_update_routed_killswitch_connection_returns_false_when_update_fails(
+        _kill_switch_connection_class, _get_connection_fingerprint, update_future_factory,
+        nm_client
+):
+    nm_client.get_active_connection_async.return_value = _resolved_future(Mock())
+    nm_client.get_connection_async.return_value = _resolved_future(Mock())
+    update_future = update_future_factory()
+    nm_client.update_connection_async.return_value = update_future
+    handler = KillSwitchConnectionHandler(
+        nm_client, connection_prefix="test", timeouts={"update_connection": 0.01}
+    )
+
+    assert not await handler.update_routed_killswitch_connection("1.1.1.1", permanent=False)
+
+    assert update_future.done()
+
+
+@pytest.mark.asyncio
+@patch(f"{HANDLER_MODULE}.get_connection_fingerprint", return_value="outdated")
+@patch(f"{HANDLER_MODULE}.KillSwitchConnection")
+async def test_add_full_killswitch_connection_updates_active_connection_with_other_settings(
+        kill_switch_connection_class, _get_connection_fingerprint, nm_client
+):
+    connection = Mock()
+    nm_client.get_active_connection_async.return_value = _resolved_future(Mock())
+    nm_client.get_connection_async.return_value = _resolved_future(connection)
+    nm_client.update_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    await handler.add_full_killswitch_connection(permanent=False)
+
+    nm_client.update_connection_async.assert_called_once_with(
+        connection, kill_switch_connection_class.return_value.connection
+    )
+    nm_client.add_connection_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_remove_full_killswitch_connection_keeping_permanent_profile_deactivates_it(
+        nm_client
+):
+    active_connection = Mock()
+    nm_client.get_active_connection_async.side_effect = lambda conn_id: _resolved_future(
+        active_connection if conn_id == "test-killswitch-perm" else None
+    )
+    nm_client.deactivate_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(
+        nm_client, connection_prefix="test", reuse_permanent_connection=True
+    )
+
+    await handler.remove_full_killswitch_connection(keep_permanent_profile=True)
+
+    nm_client.deactivate_connection_async.assert_called_once_with(active_connection)
+    nm_client.remove_connection_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_batch_runs_operations_concurrently_and_collects_results_and_errors(nm_client):
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+    both_operations_started = asyncio.Event()
+    started_operations = []
+
+    async def operation(name, error=None):
+        started_operations.append(name)
+        if len(started_operations) == 2:
+            both_operations_started.set()
+        await asyncio.wait_for(both_operations_started.wait(), timeout=1)
+        if error:
+            raise error
+        return name
+
+    error = RuntimeError("Expected error")
+    results = await handler.run_batch({
+        "first": operation("first"),
+        "second": operation("second", error=error)
+    })
+
+    assert [(r.name, r.succeeded, r.result, r.error) for r in results] == [
+        ("first", True, "first", None),
+        ("second", False, None, error)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_run_batch_raises_first_error_once_all_operations_are_done(nm_client):
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+    completed_operations = []
+
+    async def operation(name, error=None):
+        await asyncio.sleep(0)
+        completed_operations.append(name)
+        if error:
+            raise error
+
+    with pytest.raises(RuntimeError, match="first error"):
+        await handler.run_batch({
+            "first": operation("first", error=RuntimeError("first error")),
+            "second": operation("second", error=RuntimeError("second error")),
+            "third": operation("third"),
+        }, raise_first_error=True)
+
+    assert sorted(completed_operations) == ["first", "second", "third"]
+
+
+@pytest.mark.asyncio
+async def test_timed_out_operation_is_cancelled_after_its_configured_timeout(nm_client):
+    pending_future = Future()
+    nm_client.add_connection_async.return_value = pending_future
+    handler = KillSwitchConnectionHandler(
+        nm_client, connection_prefix="test", timeouts={"add_connection": 0.01}
+    )
+
+    with patch(f"{HANDLER_MODULE}.KillSwitchConnection"):
+        with pytest.raises(asyncio.TimeoutError):
+            await handler.add_ipv6_leak_protection()
+
+    assert pending_future.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_transaction_rolls_back_checkpoint_on_error(nm_client):
+    checkpoint = Mock()
+    nm_client.checkpoints.can_create.return_value = True
+    nm_client.checkpoints.create_async.return_value = _resolved_future(checkpoint)
+    nm_client.checkpoints.rollback_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    with pytest.raises(RuntimeError):
+        async with handler.transaction():
+            raise RuntimeError("Step failed.")
+
+    nm_client.checkpoints.rollback_async.assert_called_once_with(checkpoint)
+    nm_client.checkpoints.destroy_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_transaction_destroys_checkpoint_on_success(nm_client):
+    checkpoint = Mock()
+    nm_client.checkpoints.can_create.return_value = True
+    nm_client.checkpoints.create_async.return_value = _resolved_future(checkpoint)
+    nm_client.checkpoints.destroy_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    async with handler.transaction():
+        pass
+
+    nm_client.checkpoints.destroy_async.assert_called_once_with(checkpoint)
+    nm_client.checkpoints.rollback_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_transaction_retries_destroying_checkpoint(nm_client):
+    nm_client.checkpoints.can_create.return_value = True
+    nm_client.checkpoints.create_async.return_value = _resolved_future(Mock())
+    failed_future = Future()
+    failed_future.set_exception(RuntimeError("Expected error"))
+    nm_client.checkpoints.destroy_async.side_effect = [failed_future, _resolved_future()]
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    async with handler.transaction():
+        pass
+
+    assert nm_client.checkpoints.destroy_async.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_transaction_rolls_back_and_raises_error_when_checkpoint_can_not_be_destroyed(
+        nm_client
+):
+    checkpoint = Mock()
+    nm_client.checkpoints.can_create.return_value = True
+    nm_client.checkpoints.create_async.return_value = _resolved_future(checkpoint)
+    nm_client.checkpoints.rollback_async.return_value = _resolved_future()
+
+    def _destroy_async(_checkpoint):
+        future = Future()
+        future.set_exception(RuntimeError("Expected error"))
+        return future
+
+    nm_client.checkpoints.destroy_async.side_effect = _destroy_async
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    with pytest.raises(RuntimeError, match="changes were rolled back"):
+        async with handler.transaction():
+            pass
+
+    nm_client.checkpoints.rollback_async.assert_called_once_with(checkpoint)
+
+
+@pytest.mark.asyncio
+async def test_transaction_runs_without_checkpoint_when_not_allowed(nm_client):
+    nm_client.checkpoints.can_create.return_value = False
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    with pytest.raises(RuntimeError):
+        async with handler.transaction():
+            raise RuntimeError("Step failed.")
+
+    nm_client.checkpoints.create_async.assert_not_called()
+    nm_client.checkpoints.rollback_async.assert_not_called()
+
+
+def _connection(connection_id, interface_name, uuid=None):
+    connection = Mock()
+    connection.get_id.return_value = connection_id
+    connection.get_interface_name.return_value = interface_name
+    connection.get_uuid.return_value = uuid or f"{connection_id}-uuid"
+    return connection
+
+
+@pytest.mark.asyncio
+async def test_reconcile_removes_undesired_killswitch_connections_in_a_single_scan(nm_client):
+    desired = _connection("test-killswitch-perm", "pvpnksintrf1")
+    duplicated = _connection("test-killswitch-perm", "pvpnksintrf1", uuid="duplicated")
+    orphans = [
+        _connection("test-routed-killswitch", "pvpnrouteintrf0"),
+        _connection("test-killswitch-ipv6", "ipv6leakintrf0"),
+    ]
+    unrelated = [
+        _connection("Wired connection 1", "eth0"),
+        _connection("other-killswitch", "pvpnksintrf0"),
+        _connection("test-killswitch", "eth0"),
+    ]
+    nm_client.get_connections_async.return_value = _resolved_future(
+        [desired, duplicated, *orphans, *unrelated]
+    )
+    nm_client.remove_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    results = await handler.reconcile(desired_connection_ids=["test-killswitch-perm"])
+
+    nm_client.get_connections_async.assert_called_once()
+    removed = [call.args[0] for call in nm_client.remove_connection_async.call_args_list]
+    assert removed == [duplicated, *orphans]
+    assert all(result.succeeded for result in results)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_keeps_the_active_connection_among_duplicated_ones(nm_client):
+    inactive = _connection("test-killswitch-perm", "pvpnksintrf1", uuid="inactive")
+    active = _connection("test-killswitch-perm", "pvpnksintrf1", uuid="active")
+    active_connection = Mock()
+    active_connection.get_uuid.return_value = "active"
+    nm_client.get_active_connection_async.side_effect = lambda conn_id: _resolved_future(
+        active_connection if conn_id == "test-killswitch-perm" else None
+    )
+    nm_client.get_connections_async.return_value = _resolved_future([inactive, active])
+    nm_client.remove_connection_async.return_value = _resolved_future()
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    await handler.reconcile(desired_connection_ids=["test-killswitch-perm"])
+
+    nm_client.remove_connection_async.assert_called_once_with(inactive)
+
+
+def test_status_is_built_from_active_connection_states_and_cached(nm_client):
+    nm_client.get_active_connection_states.return_value = {
+        "test-routed-killswitch-perm": ("activated", 10.0),
+        "test-killswitch-ipv6": ("activating", 20.0),
+        "Wired connection 1": ("activated", 30.0),
+    }
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    status = handler.status()
+
+    assert status.mode == "routed"
+    assert status.permanent
+    assert status.ipv6_leak_protection
+    assert [connection.connection_id for connection in status.connections] == [
+        "test-killswitch-ipv6", "test-routed-killswitch-perm"
+    ]
+    assert handler.status() is status
+
+    nm_client.get_active_connection_states.return_value = {}
+    assert not handler.status().enabled
+
+
+@pytest.mark.asyncio
+async def test_connectivity_check_is_only_disabled_when_enabled(nm_client):
+    nm_client.connectivity_check_get_enabled.side_effect = [True, False]
+    nm_client.disable_connectivity_check.return_value = _resolved_future()
+    nm_client.get_active_connection_async.return_value = _resolved_future(Mock())
+    handler = KillSwitchConnectionHandler(nm_client, connection_prefix="test")
+
+    await handler.add_full_killswitch_connection(permanent=False)
+    await handler.add_full_killswitch_connection(permanent=False)
+
+    nm_client.disable_connectivity_check.assert_called_once()
@@ -0,0 +1,51 @@
+"""
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_status import (
+    KillSwitchConnectionStatus, KillSwitchStatus,
+    MODE_FULL, MODE_ROUTED, MODE_IPV6_LEAK_PROTECTION
+)
+
+
+def _connection_status(mode, permanent=False, state="activated"):
+    return KillSwitchConnectionStatus(
+        connection_id=f"pvpn-{mode}", mode=mode, permanent=permanent, state=state, since=0.0
+    )
+
+
+def test_empty_status_is_disabled():
+    status = KillSwitchStatus()
+
+    assert not status.enabled
+    assert status.mode is None
+    assert not status.permanent
+    assert not status.ipv6_leak_protection
+
+
+def test_full_mode_prevails_while_switching_modes():
+    status = KillSwitchStatus(connections=(
+        _connection_status(MODE_ROUTED),
+        _connection_status(MODE_FULL, permanent=True, state="activating"),
+        _connection_status(MODE_IPV6_LEAK_PROTECTION),
+    ))
+
+    assert status.enabled
+    assert status.mode == MODE_FULL
+    assert status.permanent
+    assert status.ipv6_leak_protection
+    assert not status.get_connection(MODE_FULL).activated
@@ -0,0 +1,67 @@
+"""
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import asyncio
+
+import pytest
+
+from proton.vpn.killswitch.backend.linux.networkmanager.metrics import (
+    InMemoryMetricsCollector, measure, OUTCOME_SUCCESS, OUTCOME_TIMEOUT, OUTCOME_ERROR
+)
+
+
+def test_measure_records_phases_and_successful_outcome():
+    collector = InMemoryMetricsCollector()
+
+    with measure(collector, "add_connection") as timer:
+        timer.mark("add_connection_finish")
+        timer.mark("device_activated")
+
+    metrics = collector.dump()
+    assert metrics["phases"]["add_connection.add_connection_finish"]["count"] == 1
+    assert metrics["phases"]["add_connection.device_activated"]["count"] == 1
+    assert metrics["operations"]["add_connection"]["count"] == 1
+    assert metrics["outcomes"] == {"add_connection": {OUTCOME_SUCCESS: 1}}
+    (_, first_phase, first_start, first_end), (_, second_phase, second_start, second_end) = \
+        metrics["events"]
+    assert (first_phase, second_phase) == ("add_connection_finish", "device_activated")
+    assert first_start <= first_end == second_start <= second_end
+
+
+@pytest.mark.parametrize("exception, expected_outcome", [
+    (asyncio.TimeoutError, OUTCOME_TIMEOUT),
+    (RuntimeError, OUTCOME_ERROR)
+])
+def test_measure_records_failed_outcome(exception, expected_outcome):
+    collector = InMemoryMetricsCollector()
+
+    with pytest.raises(exception):
+        with measure(collector, "remove_connection"):
+            raise exception()
+
+    assert collector.dump()["outcomes"] == {"remove_connection": {expected_outcome: 1}}
+
+
+def test_reset_discards_collected_metrics():
+    collector = InMemoryMetricsCollector()
+    with measure(collector, "add_connection") as timer:
+        timer.mark("device_activated")
+
+    collector.reset()
+
+    assert collector.dump() == {"phases": {}, "operations": {}, "outcomes": {}, "events": []}
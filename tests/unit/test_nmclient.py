@@ -0,0 +1,423 @@
+"""
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from threading import Thread, current_thread
+from unittest.mock import Mock, patch
+
+import pytest
+
+from proton.vpn.killswitch.backend.linux.networkmanager.device_signals import (
+    DeviceSignalDispatcher
+)
+from proton.vpn.killswitch.backend.linux.networkmanager.nmclient import NMClient, NM, GLib
+
+NMCLIENT_MODULE = "proton.vpn.killswitch.backend.linux.networkmanager.nmclient"
+INTERFACE_NAME = "pvpnksintrf0"
+
+
+@pytest.fixture
+def dispatcher():
+    return DeviceSignalDispatcher()
+
+
+@pytest.fixture
+def nm_client(dispatcher):
+    """NMClient running the work meant for the GLib loop thread synchronously,
+    on top of a mocked NM.Client."""
+    main_context = Mock()
+    main_context.is_owner.return_value = True
+    main_context.invoke_full.side_effect = lambda priority, function: function()
+    with patch.multiple(
+        NMClient,
+        _main_context=main_context,
+        _nm_client=Mock(),
+        _index=Mock(),
+        _device_dispatcher=dispatcher,
+        _pending_operations=set(),
+        _connectivity_check_enabled=True,
+        _disable_connectivity_check_future=None,
+    ):
+        NMClient._index.get_device.return_value = None
+        yield NMClient()
+
+
+def _connection(uuid="ks-uuid"):
+    connection = Mock()
+    connection.get_interface_name.return_value = INTERFACE_NAME
+    connection.get_uuid.return_value = uuid
+    # The connection is deleted right away.
+    connection.delete_async.side_effect = (
+        lambda cancellable, callback, user_data: callback(connection, Mock(), user_data)
+    )
+    return connection
+
+
+def _device(state=NM.DeviceState.ACTIVATED, active_connection_uuid="ks-uuid"):
+    device = Mock()
+    device.get_iface.return_value = INTERFACE_NAME
+    device.get_state.return_value = state
+    if active_connection_uuid:
+        device.get_active_connection.return_value.get_uuid.return_value = active_connection_uuid
+    else:
+        device.get_active_connection.return_value = None
+    return device
+
+
+def _waiters(dispatcher, signal):
+    return dict(dispatcher._waiters[signal])
+
+
+@pytest.mark.parametrize("device", [
+    None,
+    _device(state=NM.DeviceState.DISCONNECTED, active_connection_uuid=None),
+    _device(active_connection_uuid="other-uuid"),
+])
+def test_remove_connection_async_resolves_without_device_removal_when_connection_is_inactive(
+        device, nm_client, dispatcher
+):
+    """Inactive saved profiles, like the permanent one when reusing it,
+    don't have a device which will be removed."""
+    NMClient._index.get_device.return_value = device
+    connection = _connection()
+
+    future = nm_client.remove_connection_async(connection)
+
+    assert future.result(timeout=0) is None
+    connection.delete_async.assert_called_once()
+    assert not _waiters(dispatcher, DeviceSignalDispatcher.DEVICE_REMOVED)
+
+
+def test_remove_connection_async_waits_for_device_removal_when_connection_is_active(
+        nm_client, dispatcher
+):
+    device = _device()
+    NMClient._index.get_device.return_value = device
+
+    future = nm_client.remove_connection_async(_connection())
+
+    assert not future.done()
+
+    dispatcher._dispatch(Mock(), device, DeviceSignalDispatcher.DEVICE_REMOVED)
+
+    assert future.result(timeout=0) is None
+    assert not _waiters(dispatcher, DeviceSignalDispatcher.DEVICE_REMOVED)
+
+
+@pytest.fixture
+def new_clone():
+    with patch(f"{NMCLIENT_MODULE}.NM.SimpleConnection.new_clone") as new_clone_mock:
+        yield new_clone_mock
+
+
+def _updatable_connection():
+    connection = _connection()
+    connection.update2.side_effect = (
+        lambda settings, flags, args, cancellable, callback, user_data:
+        callback(connection, Mock(), user_data)
+    )
+    return connection
+
+
+def test_update_connection_async_updates_settings_and_reapplies_them_to_the_device(
+        nm_client, new_clone
+):
+    device = _device()
+    device.reapply_async.side_effect = (
+        lambda connection, version_id, flags, cancellable, callback, user_data:
+        callback(device, Mock(), user_data)
+    )
+    NMClient._index.get_device.return_value = device
+    connection = _updatable_connection()
+    new_connection = Mock()
+
+    future = nm_client.update_connection_async(connection, new_connection)
+
+    assert future.result(timeout=0) is None
+    updated_connection = new_clone.return_value
+    new_clone.assert_called_once_with(connection)
+    updated_connection.add_setting.assert_any_call(
+        new_connection.get_setting_ip4_config.return_value.duplicate.return_value
+    )
+    updated_connection.add_setting.assert_any_call(
+        new_connection.get_setting_ip6_config.return_value.duplicate.return_value
+    )
+    updated_connection.add_setting.assert_any_call(
+        new_connection.get_setting_by_name.return_value.duplicate.return_value
+    )
+    assert connection.update2.call_args.args[0] == updated_connection.to_dbus.return_value
+    assert device.reapply_async.call_args.args[0] is updated_connection
+
+
+@pytest.mark.usefixtures("new_clone")
+def test_update_connection_async_fails_when_connection_can_not_be_updated(nm_client):
+    connection = _updatable_connection()
+    connection.update2_finish.side_effect = Exception("update2 failed")
+
+    future = nm_client.update_connection_async(connection, Mock())
+
+    with pytest.raises(RuntimeError, match="Error updating KS connection"):
+        future.result(timeout=0)
+
+
+@pytest.mark.usefixtures("new_clone")
+def test_update_connection_async_fails_when_device_is_not_found(nm_client):
+    NMClient._index.get_device.return_value = None
+
+    future = nm_client.update_connection_async(_updatable_connection(), Mock())
+
+    with pytest.raises(RuntimeError, match=f"Device {INTERFACE_NAME} not found"):
+        future.result(timeout=0)
+
+
+@pytest.fixture
+def signal_handler_disconnect():
+    with patch(f"{NMCLIENT_MODULE}.GObject.signal_handler_disconnect") as disconnect_mock:
+        yield disconnect_mock
+
+
+def _activatable_connection():
+    connection = _connection()
+    NMClient._nm_client.activate_connection_async.side_effect = (
+        lambda connection, device, specific_object, cancellable, callback, user_data:
+        callback(NMClient._nm_client, Mock(), user_data)
+    )
+    return connection
+
+
+def _emit_state_changed(device, new_state):
+    (signal, callback), _ = device.connect.call_args
+    assert signal == "state-changed"
+    callback(device, new_state, NM.DeviceState.UNKNOWN, 0)
+
+
+def test_activate_connection_async_resolves_immediately_when_device_is_already_activated(
+        nm_client, signal_handler_disconnect, dispatcher
+):
+    device = _device(state=NM.DeviceState.ACTIVATED, active_connection_uuid="ks-uuid")
+    NMClient._index.get_device.return_value = device
+
+    future = nm_client.activate_connection_async(_activatable_connection())
+
+    assert future.result(timeout=0) is None
+    signal_handler_disconnect.assert_called_once_with(device, device.connect.return_value)
+    assert not _waiters(dispatcher, DeviceSignalDispatcher.DEVICE_ADDED)
+
+
+def test_activate_connection_async_waits_for_state_change_when_device_has_other_connection(
+        nm_client, signal_handler_disconnect
+):
+    device = _device(state=NM.DeviceState.ACTIVATED, active_connection_uuid="other-uuid")
+    NMClient._index.get_device.return_value = device
+
+    future = nm_client.activate_connection_async(_activatable_connection())
+
+    assert not future.done()
+
+    # The device is still activated with the other connection.
+    _emit_state_changed(device, NM.DeviceState.ACTIVATED)
+    assert not future.done()
+
+    device.get_active_connection.return_value.get_uuid.return_value = "ks-uuid"
+    _emit_state_changed(device, NM.DeviceState.ACTIVATED)
+
+    assert future.result(timeout=0) is None
+    signal_handler_disconnect.assert_called_once_with(device, device.connect.return_value)
+
+
+@pytest.mark.usefixtures("signal_handler_disconnect")
+def test_activate_connection_async_waits_for_device_to_be_added_when_not_existing(
+        nm_client, dispatcher
+):
+    future = nm_client.activate_connection_async(_activatable_connection())
+
+    assert not future.done()
+
+    device = _device(state=NM.DeviceState.DISCONNECTED)
+    dispatcher._dispatch(Mock(), device, DeviceSignalDispatcher.DEVICE_ADDED)
+    assert not future.done()
+
+    _emit_state_changed(device, NM.DeviceState.ACTIVATED)
+
+    assert future.result(timeout=0) is None
+    assert not _waiters(dispatcher, DeviceSignalDispatcher.DEVICE_ADDED)
+
+
+@pytest.fixture
+def nm_client_class():
+    """Patches NM.Client so that NMClient can be started without NetworkManager."""
+    with patch(f"{NMCLIENT_MODULE}.NM.Client") as nm_client_class_mock:
+        nm_client_mock = nm_client_class_mock.new.return_value
+        nm_client_mock.get_connections.return_value = []
+        nm_client_mock.get_active_connections.return_value = []
+        nm_client_mock.get_devices.return_value = []
+        nm_client_mock.connectivity_check_get_enabled.return_value = False
+        try:
+            yield nm_client_class_mock
+        finally:
+            NMClient.shutdown()
+
+
+def test_start_creates_client_on_dedicated_glib_loop_thread_and_shutdown_stops_it(
+        nm_client_class
+):
+    client_threads = []
+    nm_client_class.new.side_effect = lambda cancellable: (
+        client_threads.append(current_thread()) or nm_client_class.new.return_value
+    )
+
+    NMClient.start()
+    NMClient.start()  # Already started, so it does nothing.
+
+    loop_thread = NMClient._loop_thread
+    assert loop_thread.is_alive()
+    assert client_threads == [loop_thread]
+    assert NMClient().get_nm_running_async().result(timeout=1) is not None
+
+    NMClient.shutdown()
+
+    assert not loop_thread.is_alive()
+    assert NMClient._nm_client is None
+
+
+@pytest.mark.usefixtures("nm_client_class")
+def test_shutdown_cancels_operations_still_pending_after_the_timeout():
+    NMClient.start()
+    future, cancellable = NMClient()._create_operation_future()
+    loop_thread = NMClient._loop_thread
+
+    NMClient.shutdown(timeout=0)
+
+    assert future.cancelled()
+    # The GLib loop thread might not be done yet, since it was not waited for.
+    loop_thread.join(timeout=1)
+    assert not loop_thread.is_alive()
+    # The cancellation was dispatched before the GLib loop quit.
+    assert cancellable.is_cancelled()
+
+
+def test_start_with_external_main_context_does_not_start_a_glib_loop_thread(nm_client_class):
+    main_context = GLib.MainContext()
+    # The thread iterating the main context is the one starting the client.
+    main_context.push_thread_default()
+    try:
+        NMClient.start(main_context)
+
+        assert NMClient._main_context is main_context
+        assert NMClient._loop_thread is None
+        nm_client_class.new.assert_called_once()
+
+        NMClient.shutdown()
+
+        assert NMClient._nm_client is None
+    finally:
+        main_context.pop_thread_default()
+
+
+def test_client_can_be_started_again_after_shutdown(nm_client_class):
+    NMClient.start()
+    NMClient.shutdown()
+
+    NMClient.start()
+
+    assert NMClient._loop_thread.is_alive()
+    assert nm_client_class.new.call_count == 2
+
+
+def _pending_dbus_set_property():
+    """Makes the D-Bus call setting the property pending and returns
+    the function completing it."""
+    NMClient._nm_client.get_version.return_value = "1.40.0"
+    NMClient._nm_client.dbus_set_property_finish.return_value = True
+
+    def _complete():
+        args, _ = NMClient._nm_client.dbus_set_property.call_args
+        callback, user_data = args[-2], args[-1]
+        callback(NMClient._nm_client, Mock(), user_data)
+
+    return _complete
+
+
+def test_concurrent_disable_connectivity_check_calls_share_a_single_dbus_request(nm_client):
+    complete_dbus_request = _pending_dbus_set_property()
+
+    first_future = nm_client.disable_connectivity_check()
+    second_future = nm_client.disable_connectivity_check()
+
+    assert first_future is not second_future
+    NMClient._nm_client.dbus_set_property.assert_called_once()
+
+    complete_dbus_request()
+
+    assert first_future.result(timeout=0) is None
+    assert second_future.result(timeout=0) is None
+    assert not nm_client.connectivity_check_get_enabled()
+    # Once disabled, there is no need to send any other request.
+    assert nm_client.disable_connectivity_check().result(timeout=0) is None
+    NMClient._nm_client.dbus_set_property.assert_called_once()
+
+
+def test_cancelling_one_disable_connectivity_check_call_does_not_cancel_the_others(nm_client):
+    complete_dbus_request = _pending_dbus_set_property()
+    first_future = nm_client.disable_connectivity_check()
+    second_future = nm_client.disable_connectivity_check()
+    args, _ = NMClient._nm_client.dbus_set_property.call_args
+    cancellable = args[5]
+
+    first_future.cancel()
+
+    assert not second_future.done()
+    assert not cancellable.is_cancelled()
+
+    complete_dbus_request()
+
+    assert second_future.result(timeout=0) is None
+
+
+def test_disable_connectivity_check_sends_a_new_request_after_a_failed_one(nm_client):
+    complete_dbus_request = _pending_dbus_set_property()
+    NMClient._nm_client.dbus_set_property_finish.return_value = False
+    future = nm_client.disable_connectivity_check()
+    complete_dbus_request()
+
+    with pytest.raises(RuntimeError):
+        future.result(timeout=0)
+
+    assert nm_client.connectivity_check_get_enabled()
+
+    nm_client.disable_connectivity_check()
+
+    assert NMClient._nm_client.dbus_set_property.call_count == 2
+
+
+def test_disable_connectivity_check_with_nm_older_than_1_24_uses_deprecated_method(nm_client):
+    NMClient._nm_client.get_version.return_value = "1.22.10"
+    futures = []
+    # The request is completed right away, since the GLib work is run inline.
+    calling_thread = Thread(
+        target=lambda: futures.append(nm_client.disable_connectivity_check()), daemon=True
+    )
+
+    calling_thread.start()
+    calling_thread.join(timeout=1)
+
+    assert not calling_thread.is_alive(), "disable_connectivity_check() did not return."
+    assert futures[0].exception(timeout=0) is None
+    NMClient._nm_client.connectivity_check_set_enabled.assert_called_once_with(False)
+    NMClient._nm_client.dbus_set_property.assert_not_called()
+    assert not nm_client.connectivity_check_get_enabled()
+    assert NMClient._disable_connectivity_check_future is None
@@ -16,10 +16,16 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
 """
-from unittest.mock import Mock, AsyncMock, call
+from contextlib import asynccontextmanager
+from unittest.mock import Mock, AsyncMock, call, patch
 import pytest
 
 from proton.vpn.killswitch.backend.linux.networkmanager import NMKillSwitch
+from proton.vpn.killswitch.backend.linux.networkmanager.killswitch_connection_handler import (
+    KillSwitchConnectionHandler
+)
+
+NMKILLSWITCH_MODULE = "proton.vpn.killswitch.backend.linux.networkmanager.nmkillswitch"
 
 
 @pytest.fixture
@@ -53,31 +59,69 @@ async def test_enable_with_vpn_server(vpn_server):
      4) The full KS is removed to let the routed KS take over.
     """
     ks_handler_mock = AsyncMock()
+    ks_handler_mock.update_routed_killswitch_connection.return_value = False
     nm_killswitch = NMKillSwitch(ks_handler_mock)
 
     await nm_killswitch.enable(vpn_server)
 
     assert ks_handler_mock.method_calls == [
+        call.update_routed_killswitch_connection(vpn_server.server_ip, False),
         call.add_full_killswitch_connection(False),
         call.remove_routed_killswitch_connection(),
         call.add_routed_killswitch_connection(vpn_server.server_ip, False),
-        call.remove_full_killswitch_connection()
+        call.remove_full_killswitch_connection(keep_permanent_profile=False)
     ]
 
 
 @pytest.mark.asyncio
-async def test_disable_killswitch_removes_full_and_routed_ks():
+async def test_enable_with_vpn_server_updates_routed_ks_in_place_when_already_enabled(vpn_server):
     ks_handler_mock = AsyncMock()
+    ks_handler_mock.update_routed_killswitch_connection.return_value = True
     nm_killswitch = NMKillSwitch(ks_handler_mock)
 
-    await nm_killswitch.disable()
+    await nm_killswitch.enable(vpn_server)
 
     assert ks_handler_mock.method_calls == [
-        call.remove_full_killswitch_connection(),
-        call.remove_routed_killswitch_connection()
+        call.update_routed_killswitch_connection(vpn_server.server_ip, False),
+        call.remove_full_killswitch_connection(keep_permanent_profile=False)
     ]
 
 
+def _mock_ks_handler_running_batches():
+    ks_handler_mock = AsyncMock()
+
+    async def _run_batch(operations, **kwargs):
+        return await KillSwitchConnectionHandler.run_batch(ks_handler_mock, operations, **kwargs)
+
+    ks_handler_mock.run_batch.side_effect = _run_batch
+    return ks_handler_mock
+
+
+@pytest.mark.asyncio
+async def test_disable_killswitch_removes_full_and_routed_ks():
+    ks_handler_mock = _mock_ks_handler_running_batches()
+    nm_killswitch = NMKillSwitch(ks_handler_mock)
+
+    await nm_killswitch.disable()
+
+    ks_handler_mock.remove_full_killswitch_connection.assert_awaited_once_with()
+    ks_handler_mock.remove_routed_killswitch_connection.assert_awaited_once_with()
+    ks_handler_mock.run_batch.assert_awaited_once()
+    assert ks_handler_mock.run_batch.call_args.kwargs == {"raise_first_error": True}
+
+
+@pytest.mark.asyncio
+async def test_disable_killswitch_raises_first_error_once_both_removals_are_done():
+    ks_handler_mock = _mock_ks_handler_running_batches()
+    ks_handler_mock.remove_full_killswitch_connection.side_effect = RuntimeError("full")
+    nm_killswitch = NMKillSwitch(ks_handler_mock)
+
+    with pytest.raises(RuntimeError, match="full"):
+        await nm_killswitch.disable()
+
+    ks_handler_mock.remove_routed_killswitch_connection.assert_awaited_once_with()
+
+
 @pytest.mark.asyncio
 async def test_enable_ipv6_leak_protection_adds_ipv6_ks():
     ks_handler_mock = AsyncMock()
@@ -101,3 +145,33 @@ async def test_disable_ipv6_leak_protection_removes_ipv6_ks():
         call.remove_ipv6_leak_protection()
     ]
 
+
+@patch(f"{NMKILLSWITCH_MODULE}.is_network_manager_running", Mock(return_value=False))
+def test_validate_returns_false_when_network_manager_is_not_running():
+    assert not NMKillSwitch._validate()
+
+
+@patch(f"{NMKILLSWITCH_MODULE}.is_package_installed", Mock(return_value=False))
+@patch(f"{NMKILLSWITCH_MODULE}.is_network_manager_running", Mock(return_value=True))
+def test_validate_returns_true_when_network_manager_is_running():
+    assert NMKillSwitch._validate()
+
+
+@pytest.mark.asyncio
+async def test_transactional_enable_runs_all_steps_within_a_transaction(vpn_server):
+    transaction_events = []
+
+    @asynccontextmanager
+    async def transaction():
+        transaction_events.append("begin")
+        yield
+        transaction_events.append(("commit", len(ks_handler_mock.method_calls)))
+
+    ks_handler_mock = AsyncMock()
+    ks_handler_mock.transaction = transaction
+    ks_handler_mock.update_routed_killswitch_connection.return_value = False
+    nm_killswitch = NMKillSwitch(ks_handler_mock, transactional=True)
+
+    await nm_killswitch.enable(vpn_server)
+
+    assert transaction_events == ["begin", ("commit", 5)]
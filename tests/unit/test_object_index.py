@@ -0,0 +1,169 @@
+"""
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from unittest.mock import Mock
+
+import pytest
+
+from proton.vpn.killswitch.backend.linux.networkmanager.object_index import NMObjectIndex, NM
+
+
+def _connection(conn_id):
+    connection = Mock()
+    connection.get_id.return_value = conn_id
+    return connection
+
+
+def _active_connection(conn_id, state=NM.ActiveConnectionState.ACTIVATED):
+    active_connection = _connection(conn_id)
+    active_connection.get_state.return_value = state
+    return active_connection
+
+
+def _device(interface_name):
+    device = Mock()
+    device.get_iface.return_value = interface_name
+    return device
+
+
+def _emit(gobject, signal, *args):
+    """Calls the handler connected to the signal, as the GObject would do."""
+    callbacks = [
+        connect_call.args[1] for connect_call in gobject.connect.call_args_list
+        if connect_call.args[0] == signal
+    ]
+    assert len(callbacks) == 1
+    callbacks[0](gobject, *args)
+
+
+@pytest.fixture
+def nm_client():
+    nm_client_mock = Mock()
+    nm_client_mock.get_connections.return_value = []
+    nm_client_mock.get_active_connections.return_value = []
+    nm_client_mock.get_devices.return_value = []
+    return nm_client_mock
+
+
+def test_attach_indexes_the_objects_already_known_by_the_client(nm_client):
+    connection = _connection("pvpn-killswitch")
+    active_connection = _active_connection("pvpn-killswitch")
+    device = _device("pvpnksintrf0")
+    nm_client.get_connections.return_value = [connection]
+    nm_client.get_active_connections.return_value = [active_connection]
+    nm_client.get_devices.return_value = [device]
+    index = NMObjectIndex()
+
+    index.attach(nm_client)
+
+    assert index.get_connection("pvpn-killswitch") is connection
+    assert index.get_active_connection("pvpn-killswitch") is active_connection
+    assert index.get_device("pvpnksintrf0") is device
+    assert index.get_active_connection_states()["pvpn-killswitch"][0] == "activated"
+
+
+def test_connections_and_devices_are_indexed_and_cleaned_up_on_client_signals(nm_client):
+    index = NMObjectIndex()
+    index.attach(nm_client)
+    connection = _connection("pvpn-killswitch")
+    device = _device("pvpnksintrf0")
+
+    _emit(nm_client, "connection-added", connection)
+    _emit(nm_client, "device-added", device)
+
+    assert index.get_connection("pvpn-killswitch") is connection
+    assert index.get_device("pvpnksintrf0") is device
+
+    _emit(nm_client, "connection-removed", connection)
+    _emit(nm_client, "device-removed", device)
+
+    assert index.get_connection("pvpn-killswitch") is None
+    assert index.get_device("pvpnksintrf0") is None
+
+
+def test_removed_connection_is_looked_up_by_identity(nm_client):
+    index = NMObjectIndex()
+    index.attach(nm_client)
+    connection = _connection("pvpn-killswitch")
+    _emit(nm_client, "connection-added", connection)
+
+    # The ID of the connection changed before it was removed.
+    connection.get_id.return_value = "renamed"
+    _emit(nm_client, "connection-removed", connection)
+
+    assert index.get_connection("pvpn-killswitch") is None
+
+
+def test_connections_sharing_their_id_are_kept_until_all_of_them_are_removed(nm_client):
+    index = NMObjectIndex()
+    index.attach(nm_client)
+    first_connection = _connection("pvpn-killswitch")
+    second_connection = _connection("pvpn-killswitch")
+    _emit(nm_client, "connection-added", first_connection)
+    _emit(nm_client, "connection-added", second_connection)
+
+    assert index.get_connection("pvpn-killswitch") is second_connection
+
+    _emit(nm_client, "connection-removed", second_connection)
+
+    assert index.get_connection("pvpn-killswitch") is first_connection
+
+    _emit(nm_client, "connection-removed", first_connection)
+
+    assert index.get_connection("pvpn-killswitch") is None
+
+
+def test_active_connection_states_are_kept_up_to_date_on_client_signals(nm_client):
+    index = NMObjectIndex()
+    index.attach(nm_client)
+    active_connection = _active_connection(
+        "pvpn-killswitch", state=NM.ActiveConnectionState.ACTIVATING
+    )
+
+    _emit(nm_client, "active-connection-added", active_connection)
+
+    states = index.get_active_connection_states()
+    assert states["pvpn-killswitch"][0] == "activating"
+    assert index.get_active_connection_states() is states
+
+    _emit(active_connection, "state-changed", NM.ActiveConnectionState.ACTIVATED, 0)
+
+    states = index.get_active_connection_states()
+    assert states["pvpn-killswitch"][0] == "activated"
+
+    _emit(nm_client, "active-connection-removed", active_connection)
+
+    assert index.get_active_connection("pvpn-killswitch") is None
+    assert "pvpn-killswitch" not in index.get_active_connection_states()
+    active_connection.disconnect.assert_called_once_with(active_connection.connect.return_value)
+
+
+def test_state_changes_of_replaced_active_connections_are_ignored(nm_client):
+    index = NMObjectIndex()
+    index.attach(nm_client)
+    old_active_connection = _active_connection("pvpn-killswitch")
+    new_active_connection = _active_connection(
+        "pvpn-killswitch", state=NM.ActiveConnectionState.ACTIVATING
+    )
+    _emit(nm_client, "active-connection-added", old_active_connection)
+    _emit(nm_client, "active-connection-added", new_active_connection)
+
+    _emit(old_active_connection, "state-changed", NM.ActiveConnectionState.DEACTIVATED, 0)
+
+    assert index.get_active_connection("pvpn-killswitch") is new_active_connection
+    assert index.get_active_connection_states()["pvpn-killswitch"][0] == "activating"
@@ -0,0 +1,102 @@
+"""
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+from ipaddress import ip_network
+
+import pytest
+
+from proton.vpn.killswitch.backend.linux.networkmanager import route_planner
+from proton.vpn.killswitch.backend.linux.networkmanager.route_planner import (
+    create_network_set, get_routes_excluding
+)
+
+
+def _to_networks(routes):
+    return sorted(ip_network(f"{address}/{prefix}") for address, prefix in routes)
+
+
+@pytest.mark.parametrize("server_ip", ["1.1.1.1", "192.168.1.1", "255.255.255.255", "0.0.0.0"])
+def test_get_routes_excluding_single_ip_matches_address_exclude(server_ip):
+    expected_routes = sorted(ip_network("0.0.0.0/0").address_exclude(ip_network(server_ip)))
+
+    assert _to_networks(get_routes_excluding([server_ip])) == expected_routes
+
+
+def test_get_routes_excluding_returns_minimal_routes_not_overlapping_excluded_networks():
+    excluded = [ip_network(n) for n in ("10.0.0.0/8", "10.1.0.0/16", "10.0.0.1", "192.168.1.0/24")]
+
+    routes = _to_networks(get_routes_excluding(str(n) for n in excluded))
+
+    assert not any(route.overlaps(network) for route in routes for network in excluded)
+    # 10.0.0.0/8 includes the other 10.x networks.
+    excluded_addresses = 2 ** 24 + 2 ** 8
+    assert sum(route.num_addresses for route in routes) == 2 ** 32 - excluded_addresses
+    # Excluding a /8 and a /24 network takes 8 and 24 routes respectively, minus
+    # the two /1 routes that would cover the other excluded network.
+    assert len(routes) == 8 + 24 - 2
+
+
+def test_get_routes_excluding_without_excluded_networks_returns_default_route():
+    assert get_routes_excluding([]) == (("0.0.0.0", 0),)
+
+
+def test_get_routes_excluding_ignores_networks_of_other_ip_versions():
+    assert get_routes_excluding(["2001:db8::1"]) == (("0.0.0.0", 0),)
+
+
+def test_get_routes_excluding_ipv6_address():
+    expected_routes = sorted(ip_network("::/0").address_exclude(ip_network("2001:db8::1")))
+
+    assert _to_networks(get_routes_excluding(["2001:db8::1"], version=6)) == expected_routes
+
+
+def test_get_routes_excluding_caches_routes_by_excluded_set():
+    # pylint: disable=protected-access
+    route_planner._get_complement_routes.cache_clear()
+
+    routes = get_routes_excluding(["1.1.1.1", "2.2.2.2"])
+
+    assert get_routes_excluding(["2.2.2.2", "1.1.1.1/32"]) is routes
+    assert route_planner._get_complement_routes.cache_info().hits == 1
+
+
+def test_create_network_set_merges_duplicated_and_overlapping_networks():
+    network_set = create_network_set(
+        ["192.168.1.0/25", "192.168.1.128/25", "192.168.1.7", "10.0.0.0/8", "fd00::/8"]
+    )
+
+    assert network_set.get_networks(4) == (ip_network("10.0.0.0/8"), ip_network("192.168.1.0/24"))
+    assert network_set.get_networks(6) == (ip_network("fd00::/8"),)
+    assert network_set == create_network_set(["fd00::/8", "192.168.1.0/24", "10.0.0.0/8"])
+
+
+def test_get_routes_excluding_allowed_networks():
+    # pylint: disable=protected-access
+    route_planner._get_complement_routes.cache_clear()
+    allowed = [f"10.{i}.0.0/16" for i in range(256)] + ["192.168.0.0/16"]
+
+    routes = get_routes_excluding(["1.1.1.1"], allowed_networks=create_network_set(allowed))
+
+    excluded = [ip_network(n) for n in ["1.1.1.1", "10.0.0.0/8", "192.168.0.0/16"]]
+    assert _to_networks(routes) == sorted(
+        ip_network(f"{address}/{prefix}")
+        for address, prefix in get_routes_excluding(str(n) for n in excluded)
+    )
+    assert get_routes_excluding(
+        ["1.1.1.1"], allowed_networks=create_network_set(reversed(allowed))
+    ) is routes
@@ -0,0 +1,70 @@
+"""
+Copyright (c) 2023 Proton AG
+
+This file is part of Proton VPN.
+
+Proton VPN is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Proton VPN is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with ProtonVPN.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+from unittest.mock import patch
+
+import pytest
+
+from proton.vpn.killswitch.backend.linux.networkmanager.util import is_package_installed
+
+DPKG_STATUS = """Package: libnetplan1
+Status: install ok installed
+Architecture: amd64
+Version: 1.0-2
+
+Package: libnetplan0
+Status: deinstall ok config-files
+Architecture: amd64
+Version: 0.106-0
+"""
+
+
+@pytest.fixture
+def dpkg_status(tmp_path):
+    status_path = tmp_path / "status"
+    status_path.write_text(DPKG_STATUS)
+    return status_path
+
+
+def test_is_package_installed_only_reports_installed_packages(dpkg_status):
+    assert is_package_installed("libnetplan1", str(dpkg_status))
+    assert not is_package_installed("libnetplan0", str(dpkg_status))
+    assert not is_package_installed("network-manager", str(dpkg_status))
+
+
+def test_is_package_installed_returns_false_without_dpkg_database(tmp_path):
+    assert not is_package_installed("libnetplan1", str(tmp_path / "missing"))
+
+
+def test_is_package_installed_returns_false_when_dpkg_database_can_not_be_read(dpkg_status):
+    with patch("os.stat", side_effect=PermissionError("Permission denied")):
+        assert not is_package_installed("libnetplan1", str(dpkg_status))
+
+    # The database path exists but it can't be opened as a file.
+    assert not is_package_installed("libnetplan1", str(dpkg_status.parent))
+
+
+def test_is_package_installed_parses_the_database_again_once_it_changes(dpkg_status):
+    assert is_package_installed("libnetplan1", str(dpkg_status))
+
+    dpkg_status.write_text(DPKG_STATUS.replace("install ok installed", "deinstall ok removed"))
+    stat = os.stat(dpkg_status)
+    os.utime(dpkg_status, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert not is_package_installed("libnetplan1", str(dpkg_status))